@@ -0,0 +1,205 @@
+import argparse
+import os
+import time
+from urllib.parse import unquote
+
+from invoice_schema import to_paise
+
+DEFAULT_DAYS = 30
+
+
+def product_key(name):
+    """Encode a product name as a single field name: no '.' to nest it and no '$' to make it an operator.
+
+    '%' is encoded too, so product_name() can always undo it.
+    """
+    return name.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def product_name(key):
+    return unquote(key)
+
+
+# Rebuilds daily_sales from invoices in one pass: one document per day with
+# revenue_paise, invoice count, units and a per-product {units, revenue_paise}
+# breakdown keyed by product_key(). Invoice-level totals are only counted on
+# each invoice's first line item. v1 invoices (see invoice_schema) are first
+# reshaped like v2 ones: rupees to paise and products as {id or name,
+# quantity, price_paise}, with v2 product ids named via product_ids.
+REBUILD_PIPELINE = [
+    {'$addFields': {
+        'total_paise': {'$ifNull': ['$total', {'$round': [{'$multiply': ['$total_amount', 100]}, 0]}]},
+        'products': {'$ifNull': [
+            {'$map': {
+                'input': '$products',
+                'as': 'product',
+                'in': {
+                    'name': '$$product.name',
+                    'quantity': '$$product.quantity',
+                    'price_paise': {'$round': [{'$multiply': ['$$product.price', 100]}, 0]},
+                },
+            }},
+            {'$map': {
+                'input': {'$ifNull': ['$items', []]},
+                'as': 'item',
+                'in': {
+                    'id': {'$arrayElemAt': ['$$item', 0]},
+                    'quantity': {'$arrayElemAt': ['$$item', 1]},
+                    'price_paise': {'$arrayElemAt': ['$$item', 2]},
+                },
+            }},
+        ]},
+    }},
+    {'$unwind': {'path': '$products', 'includeArrayIndex': 'line', 'preserveNullAndEmptyArrays': True}},
+    {'$lookup': {'from': 'product_ids', 'localField': 'products.id', 'foreignField': '_id', 'as': 'product_ref'}},
+    {'$addFields': {'products.name': {'$ifNull': ['$products.name', {'$arrayElemAt': ['$product_ref.name', 0]}]}}},
+    # The same encoding as product_key(); a find string starting with '$' has to be a $literal
+    {'$addFields': {'products.key': {'$replaceAll': {
+        'input': {'$replaceAll': {
+            'input': {'$replaceAll': {'input': '$products.name', 'find': '%', 'replacement': '%25'}},
+            'find': '.', 'replacement': '%2E',
+        }},
+        'find': {'$literal': '$'}, 'replacement': '%24',
+    }}}},
+    {'$addFields': {'first_line': {'$lte': [{'$ifNull': ['$line', 0]}, 0]}}},
+    {'$group': {
+        '_id': {'date': '$date', 'product': '$products.key'},
+        'units': {'$sum': {'$ifNull': ['$products.quantity', 0]}},
+        'revenue_paise': {'$sum': {'$multiply': [
+            {'$ifNull': ['$products.quantity', 0]},
+            {'$ifNull': ['$products.price_paise', 0]},
+        ]}},
+        'invoice_revenue_paise': {'$sum': {'$cond': ['$first_line', '$total_paise', 0]}},
+        'invoices': {'$sum': {'$cond': ['$first_line', 1, 0]}},
+    }},
+    {'$group': {
+        '_id': '$_id.date',
+        'revenue_paise': {'$sum': '$invoice_revenue_paise'},
+        'invoices': {'$sum': '$invoices'},
+        'units': {'$sum': '$units'},
+        'products': {'$push': {'k': '$_id.product', 'v': {'units': '$units', 'revenue_paise': '$revenue_paise'}}},
+    }},
+    {'$project': {
+        'revenue_paise': 1,
+        'invoices': 1,
+        'units': 1,
+        'products': {'$arrayToObject': {
+            '$filter': {'input': '$products', 'cond': {'$ne': ['$$this.k', None]}}
+        }},
+    }},
+    {'$out': 'daily_sales'},
+]
+
+
+class SalesAnalytics:
+    def __init__(self, db):
+        """Per-day sales rollups kept in db.daily_sales.
+
+        Each document is keyed by invoice date and holds revenue_paise,
+        invoices, units and products.<product_key(name)>.{units,
+        revenue_paise}, so reports read a handful of rollup documents instead
+        of the invoice history. Money is summed in integer paise.
+        """
+        self.daily = db.daily_sales
+        self.invoices = db.invoices
+
+    def record_invoices(self, invoices):
+        """Fold newly stored invoices into the rollups with one bulk $inc upsert."""
+        from pymongo import UpdateOne
+
+        ops = []
+        for invoice in invoices:
+            increments = {
+                'revenue_paise': to_paise(invoice.get('total_amount', 0)),
+                'invoices': 1,
+                'units': 0,
+            }
+            for product in invoice.get('products') or []:
+                quantity = product.get('quantity', 0)
+                price_paise = product.get('price_paise')
+                if price_paise is None:
+                    price_paise = to_paise(product.get('price', 0))
+                increments['units'] += quantity
+                prefix = f"products.{product_key(product['name'])}"
+                increments[f'{prefix}.units'] = increments.get(f'{prefix}.units', 0) + quantity
+                increments[f'{prefix}.revenue_paise'] = (
+                    increments.get(f'{prefix}.revenue_paise', 0) + quantity * price_paise
+                )
+            ops.append(UpdateOne({'_id': invoice['date']}, {'$inc': increments}, upsert=True))
+        if ops:
+            self.daily.bulk_write(ops, ordered=False)
+
+    def rebuild(self):
+        """Recompute every rollup from the invoices collection."""
+        self.invoices.aggregate(REBUILD_PIPELINE, allowDiskUse=True)
+
+    def days(self, start_date=None, end_date=None, limit=None):
+        """Daily rollups newest first for a YYYY-MM-DD range, or the last DEFAULT_DAYS days."""
+        if limit is None and not (start_date or end_date):
+            limit = DEFAULT_DAYS
+        query = {}
+        if start_date:
+            query.setdefault('_id', {})['$gte'] = start_date
+        if end_date:
+            query.setdefault('_id', {})['$lte'] = end_date
+        cursor = self.daily.find(query).sort('_id', -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [summarize(doc) for doc in cursor]
+
+    def day(self, date):
+        doc = self.daily.find_one({'_id': date})
+        return summarize(doc or {'_id': date})
+
+    def products(self, start_date=None, end_date=None):
+        """Units and revenue per product summed over the selected days."""
+        totals = {}
+        for day in self.days(start_date, end_date):
+            for name, stats in day['products'].items():
+                total = totals.setdefault(name, {'units': 0, 'revenue_paise': 0})
+                total['units'] += stats['units']
+                total['revenue_paise'] += stats['revenue_paise']
+        for total in totals.values():
+            total['revenue'] = total['revenue_paise'] / 100
+        return totals
+
+
+def summarize(doc):
+    """Shape a daily_sales document for the API: product names decoded, rupees beside paise and the average basket."""
+    revenue_paise = doc.get('revenue_paise', 0)
+    invoices = doc.get('invoices', 0)
+    products = {}
+    for key, stats in doc.get('products', {}).items():
+        product_paise = stats.get('revenue_paise', 0)
+        products[product_name(key)] = {
+            'units': stats.get('units', 0), 'revenue_paise': product_paise, 'revenue': product_paise / 100,
+        }
+    return {
+        'date': doc['_id'],
+        'revenue': revenue_paise / 100,
+        'revenue_paise': revenue_paise,
+        'invoices': invoices,
+        'units': doc.get('units', 0),
+        'average_basket': revenue_paise / invoices / 100 if invoices else 0,
+        'products': products,
+    }
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Maintain the sales analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild all rollups from invoices")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    args = get_args()
+    if args.rebuild:
+        client = MongoClient(os.getenv('MONGODB_URI'))
+        start = time.time()
+        SalesAnalytics(client.smart_checkout).rebuild()
+        print(f"Rebuilt daily_sales in {time.time() - start:.2f}s")
@@ -1,147 +1,217 @@
-import argparse
+import sys
 import time
+
+STARTUP_BEGIN = time.perf_counter()
+startup_times = {}  # Seconds from module import to each startup milestone
+
+
+def requested_async_mode(argv):
+    """Read --server from argv before argparse runs, since gevent must patch the stdlib first."""
+    for position, arg in enumerate(argv):
+        if arg.startswith('--server='):
+            return arg.split('=', 1)[1]
+        if arg == '--server' and position + 1 < len(argv):
+            return argv[position + 1]
+    return 'threading'
+
+
+ASYNC_MODE = requested_async_mode(sys.argv[1:]) if __name__ == "__main__" else 'threading'
+if ASYNC_MODE == 'gevent':
+    # Sockets, sleeps, queues and locks become cooperative, so each viewer is a greenlet
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
 from functools import lru_cache
 import threading
-import json
-from queue import Queue
 import os
+import uuid
 from dotenv import load_dotenv
-import razorpay
-from pymongo import MongoClient
-import cv2
-from picamera2 import MappedArray, Picamera2
-from picamera2.devices.imx500 import IMX500
 from flask import Flask, Response, request, jsonify
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
+from frame_hub import select_tier
+from lane import FRAME_QUEUE_SIZE, Lane
+from overlay import OverlayRenderer
+from catalog import Catalog
+from transactions import build_query, ensure_indexes, fetch_page, stream_documents
+from invoice_journal import InvoiceJournal
+from invoice_schema import ProductIds, compact, expand
+from motion import MotionGate
+from flight_recorder import FlightRecorder
+from metrics import REGISTRY
+from frame_sources import (
+    ImageDirectorySource,
+    Picamera2Source,
+    SyntheticSource,
+    VideoFileSource,
+    synthetic_frames,
+)
 
 load_dotenv()
 
-# Global variables with locks for thread safety
-latest_detections = []
-detections_lock = threading.Lock()
-frame_queue = Queue(maxsize=10)  # Buffer for streaming frames
-PRODUCTS = None
-
-# Global variables for detection control and ingredient aggregation
-detection_active = False
-detected_ingredients = {}
-
-# MongoDB setup
-try:
-    mongo_uri = os.getenv('MONGODB_URI')
-    print(f"Attempting to connect to MongoDB with URI: {mongo_uri}")
-    client = MongoClient(mongo_uri)
-    db = client.smart_checkout
-    invoices_collection = db.invoices
-    # Test the connection
-    client.admin.command('ping')
-    print("MongoDB Atlas connected successfully")
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-
-# Razorpay setup
-razorpay_client = razorpay.Client(
-    auth=(os.getenv('RAZORPAY_KEY_ID'), os.getenv('RAZORPAY_KEY_SECRET'))
-)
+
+def mark_startup(milestone):
+    """Record and report how long after import a startup milestone was reached."""
+    startup_times[milestone] = round(time.perf_counter() - STARTUP_BEGIN, 3)
+    print(f"Startup: {milestone} after {startup_times[milestone]:.3f}s")
+
+
+lanes = {}  # Lane name -> Lane, in start order; the first is the default
+client_lanes = {}  # Socket.IO sid -> Lane whose cart it follows
+frame_ring = None  # FrameRing that lanes capture into when encoding in worker processes
+PROCESS_RUN = uuid.uuid4().hex  # Tells orders priced by this process from ones priced before a restart
+
+# External services, connected in the background by connect_services()
+invoices_collection = None
+product_ids = None
+sales_analytics = None
+payment_gateway = None
+invoice_journal = None
+
+
+def connect_services():
+    """Set up Razorpay and MongoDB off the startup path; routes answer 503 until ready."""
+    global payment_gateway
+
+    # Razorpay setup (RAZORPAY_BASE_URL points at a local stand-in when testing)
+    try:
+        from payment_gateway import PaymentGateway
+
+        payment_gateway = PaymentGateway(
+            os.getenv('RAZORPAY_KEY_ID'),
+            os.getenv('RAZORPAY_KEY_SECRET'),
+            base_url=os.getenv('RAZORPAY_BASE_URL')
+        )
+        mark_startup('payment_gateway')
+    except Exception as e:
+        print(f"Error setting up Razorpay: {e}")
+
+    # MongoDB setup, retried until it succeeds; invoices wait in the journal meanwhile
+    while not connect_mongodb():
+        time.sleep(10)
+
+
+def connect_mongodb():
+    """Connect to MongoDB and wire up indexes, analytics and the journal; return success."""
+    global invoices_collection, sales_analytics, product_ids
+    try:
+        from pymongo import MongoClient
+        from analytics import SalesAnalytics
+
+        mongo_uri = os.getenv('MONGODB_URI')
+        client = MongoClient(mongo_uri)
+        db = client.smart_checkout
+        # Test the connection
+        client.admin.command('ping')
+        print("MongoDB Atlas connected successfully")
+        ensure_indexes(db.invoices)
+        sales_analytics = SalesAnalytics(db)
+        product_ids = ProductIds(db)
+        invoices_collection = db.invoices
+        if invoice_journal is not None:
+            invoice_journal.attach(invoices_collection, lambda invoice: compact(invoice, product_ids))
+            invoice_journal.on_flush(sales_analytics.record_invoices)
+        mark_startup('mongodb')
+        return True
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        return False
+
+
+def create_frame_source(args, lane=0):
+    """Build the frame source selected on the command line for a lane index.
+
+    Picamera lanes use camera number lane; video and image lanes take the
+    lane-th entry of a comma-separated --input.
+    """
+    if args.source == 'picamera':
+        if not args.model:
+            raise SystemExit("--model is required for the picamera source")
+        return Picamera2Source(args.model, args.fps, camera=lane if args.lanes > 1 else None,
+                               show_preview=args.lanes == 1)
+    if args.source in ('video', 'images'):
+        inputs = (args.input or '').split(',')
+        if len(inputs) != args.lanes:
+            raise SystemExit(f"--input needs one comma-separated entry per lane ({args.lanes})")
+        if args.source == 'video':
+            return VideoFileSource(inputs[lane])
+        return ImageDirectorySource(inputs[lane], args.fps)
+    return SyntheticSource(args.fps, args.synthetic_detections, len(catalog.index), synthetic_frames(30, seed=lane))
+
+
+def mark_first_frame(lane):
+    """Startup milestone for a lane's first frame; 'first_frame' is the first from any lane."""
+    if 'first_frame' not in startup_times:
+        mark_startup('first_frame')
+    if len(lanes) > 1:
+        mark_startup(f'first_frame_lane_{lane.name}')
+
 
 # Initialize Flask app and SocketIO
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-
-class Detection:
-    def __init__(self, coords, category, conf, metadata):
-        """Create a Detection object with bounding box, category, and confidence."""
-        self.category = category
-        self.conf = conf
-        try:
-            self.box = imx500.convert_inference_coords(coords, metadata, picam2)
-            # Ensure box coordinates are valid integers and within frame bounds (640x480)
-            self.box = [int(max(0, min(val, 640 if i % 2 == 0 else 480))) for i, val in enumerate(self.box)]
-        except Exception as e:
-            print(f"Error converting coordinates: {e}")
-            # Fallback to scaling raw coordinates assuming normalized [0,1]
-            self.box = [int(val * (640 if i % 2 == 0 else 480)) for i, val in enumerate(coords)]
-
-
-def pre_callback(request):
-    """Process detections, draw bounding boxes on the main frame, and queue the frame for streaming."""
-    metadata = request.get_metadata()
-    np_outputs = imx500.get_outputs(metadata, add_batch=True)
-    detections = []
-    if np_outputs is not None:
-        boxes, scores, classes = np_outputs[0][0], np_outputs[2][0], np_outputs[1][0]
-        filtered_detections = [
-            (box, score, category)
-            for box, score, category in zip(boxes, scores, classes)
-            if score >= args.threshold
-        ]
-        print(f"Found {len(filtered_detections)} detections above threshold")
-        for box, score, category in filtered_detections:
-            try:
-                det = Detection(box, category, score, metadata)
-                detections.append(det)
-                print(f"Added detection for category {category} with confidence {score:.2f}")
-            except Exception as e:
-                print(f"Error creating detection: {e}")
-    
-    # Update global detections for WebSocket (regardless of detection mode)
-    with detections_lock:
-        global latest_detections
-        latest_detections = detections
-    
-    # Draw detections on the main stream
-    with MappedArray(request, "main") as m:
-        labels = get_labels()
-        for detection in detections:
-            x, y, w, h = detection.box
-            label = f"{labels[int(detection.category)]} ({detection.conf:.2f})"
-            cv2.putText(
-                m.array,
-                label,
-                (x + 5, y + 15),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (0, 255, 0),
-                2,
-            )
-            cv2.rectangle(m.array, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        if not frame_queue.full():
-            frame_queue.put(m.array.copy())
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
 
 
-@lru_cache
 def get_labels():
-    """Load and cache labels from the labels file."""
-    try:
-        with open(args.labels, 'r') as f:
-            labels = [line.strip() for line in f.readlines()]
-        print(f"Loaded {len(labels)} labels from {args.labels}")
-        return labels
-    except Exception as e:
-        print(f"Error loading labels: {e}")
-        return []
-
-
-def generate_frames():
-    """Generate MJPEG frames for video streaming from the queue."""
-    while True:
-        if not frame_queue.empty():
-            frame = frame_queue.get()
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            ret, buffer = cv2.imencode('.jpg', rgb_frame)
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        else:
-            time.sleep(0.01)
+    """Labels of the current catalog, indexed by model category."""
+    return catalog.index.labels
+
+
+@lru_cache(maxsize=1)
+def get_overlay_renderer(index):
+    """Build the overlay renderer for a catalog index with label sprites rasterized once."""
+    return OverlayRenderer(index.labels)
+
+
+def draw_overlay(frame, detections):
+    """Draw detection boxes and labels onto a frame for the overlay stream."""
+    return get_overlay_renderer(catalog.index).draw(frame, detections)
+
+
+renderers = {'overlay': draw_overlay, 'clean': None}
+
+
+def get_lane(name=None):
+    """The lane called name, or the default lane when name is empty; None if there is none."""
+    if not name:
+        return next(iter(lanes.values()), None)
+    return lanes.get(name)
+
+
+def flag(value):
+    return value.lower() not in ('0', 'false', 'no')
 
 
 @app.route('/video_feed')
 def video_feed():
-    """Serve the MJPEG video stream."""
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    """Serve the MJPEG video stream.
+
+    Query parameters: lane (default: the first lane); overlay=0 for frames without boxes drawn; tier
+    (high/medium/low/minimal) or width and quality to pick the best tier
+    within those limits; fps to cap the frame rate; adaptive=0 to stop the
+    stream stepping down a tier when this viewer cannot keep up.
+    """
+    try:
+        tier = select_tier(
+            request.args.get('tier'),
+            request.args.get('width', type=int),
+            request.args.get('quality', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    lane = get_lane(request.args.get('lane'))
+    if lane is None:
+        return jsonify({'status': 'error', 'message': 'unknown lane'}), 404
+    fps = request.args.get('fps', type=float)
+    return Response(
+        lane.generate_frames(
+            flag(request.args.get('overlay', '1')), tier,
+            fps if fps and fps > 0 else None, flag(request.args.get('adaptive', '1'))
+        ),
+        mimetype='multipart/x-mixed-replace; boundary=frame'
+    )
 
 
 @app.route('/')
@@ -355,125 +425,188 @@ def index():
     '''
 
 
+def follow_lane(sid, lane):
+    """Move a Socket.IO client to a lane's room and broadcaster."""
+    previous = client_lanes.get(sid)
+    if previous is lane:
+        return
+    if previous is not None:
+        previous.broadcaster.remove(sid)
+        leave_room(previous.room, sid=sid)
+    client_lanes[sid] = lane
+    join_room(lane.room, sid=sid)
+    lane.broadcaster.add(sid)
+
+
+def event_lane(data):
+    """The lane a client event applies to: data['lane'] if given, else the client's own lane."""
+    name = (data or {}).get('lane') if isinstance(data, dict) else None
+    return get_lane(name) if name else client_lanes.get(request.sid) or get_lane()
+
+
+@socketio.on('connect')
+def handle_connect():
+    """Follow the lane named in the connection query (?lane=), or the default lane."""
+    lane = get_lane(request.args.get('lane'))
+    if lane is None:
+        return False
+    follow_lane(request.sid, lane)
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    lane = client_lanes.pop(request.sid, None)
+    if lane is not None:
+        lane.broadcaster.remove(request.sid)
+
+
+@socketio.on('join_lane')
+def handle_join_lane(data=None):
+    """Switch this client to another lane and send it that lane's cart."""
+    lane = get_lane((data or {}).get('lane'))
+    if lane is None:
+        emit('lane_error', {'message': 'unknown lane'})
+        return
+    follow_lane(request.sid, lane)
+    emit('cart_snapshot', lane.cart.snapshot())
+
+
 @socketio.on('start_detection')
-def handle_start_detection():
-    global detection_active, detected_ingredients
-    detection_active = True
-    detected_ingredients = {}  # Reset accumulated data for new detection
-    print("Detection started.")
+def handle_start_detection(data=None):
+    lane = event_lane(data)
+    if lane is not None:
+        lane.start_detection()
 
 
 @socketio.on('stop_detection')
-def handle_stop_detection():
-    global detection_active
-    detection_active = False
-    print("Detection stopped.")
-
-
-def emit_detections():
-    """Send detection updates via WebSocket, processing new detections and updating the dashboard."""
-    global detection_active, latest_detections
-    detected_products = []
-    last_detected_product = None
-    last_detection_time = 0
-    min_detection_gap = 2  # Time gap between detections
-    
-    while True:
-        if detection_active:
-            with detections_lock:
-                current_detections = latest_detections.copy()
-            
-            current_time = time.time()
-            
-            if len(current_detections) == 1:
-                detection = current_detections[0]
-                labels = get_labels()
-                product_name = labels[int(detection.category)]
-                
-                # Check if enough time has passed since last detection
-                if current_time - last_detection_time >= min_detection_gap:
-                    # Find existing product
-                    existing_product = next(
-                        (p for p in detected_products if p['name'] == product_name), 
-                        None
-                    )
-                    
-                    if existing_product:
-                        # Increment quantity of existing product
-                        existing_product['quantity'] += 1
-                    else:
-                        # Add new product
-                        detected_products.append({
-                            'name': product_name,
-                            'quantity': 1,
-                            'price': 10 # Add actual price logic here
-                        })
-                    
-                    # Update tracking variables
-                    last_detected_product = product_name
-                    last_detection_time = current_time
-                    
-                    # Update dashboard
-                    socketio.emit('detection_update', {
-                        'products': detected_products
-                    })
-                
-        time.sleep(0.1)  # Small delay to prevent excessive updates
-
-
-def add_test_detections():
-    """Add fake detections for testing visualization.
-    
-    Cycles through different product categories to simulate scanning multiple products.
+def handle_stop_detection(data=None):
+    lane = event_lane(data)
+    if lane is not None:
+        lane.stop_detection()
+
+
+@socketio.on('cart_sync')
+def handle_cart_sync(data=None):
+    """Send a reconnecting client the cart deltas after its last seen seq.
+
+    Falls back to a full 'cart_snapshot' when those deltas are no longer kept.
     """
-    category = 0  # Start with first product
-    max_category = len(get_labels()) - 1  # Get number of available products
-    
-    while True:
-        with detections_lock:
-            global latest_detections
-            # Create a test detection with current category
-            test_detection = Detection([100, 100, 200, 150], category, 0.95, {"ScalerCrop": (480, 640)})
-            latest_detections = [test_detection]
-            label = get_labels()[category]
-            print(f"Added test detection for {label}")
-            
-            # Move to next category, loop back to 0 if at end
-            category = (category + 1) % (max_category + 1)
-            
-        time.sleep(2)
+    lane = event_lane(data)
+    if lane is None:
+        return
+    since = int((data or {}).get('seq', 0))
+    deltas = lane.cart.deltas_since(since)
+    if deltas is None:
+        emit('cart_snapshot', lane.cart.snapshot())
+    else:
+        emit('cart_deltas', {'seq': deltas[-1]['seq'] if deltas else since, 'deltas': deltas})
 
 
 def get_args():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model", type=str, required=True, help="Path to the model")
+    parser.add_argument("--source", choices=["picamera", "video", "images", "synthetic"], default="picamera",
+                        help="Where frames come from")
+    parser.add_argument("--input", type=str,
+                        help="Video file or image directory for the video/images sources, comma-separated per lane")
+    parser.add_argument("--lanes", type=int, default=1, help="Checkout lanes (camera and cart pairs) to run")
+    parser.add_argument("--synthetic-detections", type=int, default=1,
+                        help="Objects per frame for the synthetic source")
+    parser.add_argument("--model", type=str,
+                        help="Path to the model: an IMX500 .rpk, or an ONNX/OpenCV model for --backend cpu")
+    parser.add_argument("--backend", choices=["imx500", "cpu"], default="imx500",
+                        help="Where detections come from: the IMX500 (or synthetic source), or a model run on the CPU")
+    parser.add_argument("--cpu-runtime", choices=["auto", "onnxruntime", "opencv"], default="auto",
+                        help="Runtime for --backend cpu")
+    parser.add_argument("--cpu-format", choices=["ssd", "yolo"], default="ssd",
+                        help="Output layout of the --backend cpu model")
+    parser.add_argument("--input-size", type=int, help="Square input size for --backend cpu models with dynamic axes")
+    parser.add_argument("--batch-size", type=int, default=4, help="Frames per --backend cpu inference batch")
+    parser.add_argument("--inference-threads", type=int, default=0,
+                        help="Batches run at once for --backend cpu (0 = half the cores, up to 4)")
     parser.add_argument("--fps", type=int, default=15, help="Frames per second")
     parser.add_argument("--threshold", type=float, default=0.2, help="Detection threshold")
     parser.add_argument("--labels", type=str, default="assets/labels.txt", help="Path to labels file")
     parser.add_argument("--products", type=str, default="products.json", help="Path to product details JSON")
+    parser.add_argument("--journal", type=str, default="invoices.db", help="Path to the local invoice journal")
     parser.add_argument("--test-mode", action="store_true", help="Run with test detections")
+    parser.add_argument("--flight-dir", type=str, default="flight",
+                        help="Directory for each lane's detection flight recorder ring (empty to disable)")
+    parser.add_argument("--flight-records", type=int, default=1 << 20,
+                        help="Records kept per lane by the flight recorder (32 bytes each)")
+    parser.add_argument("--encode-workers", type=int, default=0,
+                        help="Worker processes for overlay drawing and JPEG encoding (0 = a thread in this process)")
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="Process every frame, even when the scene is static")
+    parser.add_argument("--motion-threshold", type=float, default=4.0,
+                        help="Percent of sampled pixels that must change to count as motion")
+    parser.add_argument("--server", choices=["threading", "gevent"], default="threading",
+                        help="Server mode: one OS thread per connection, or gevent greenlets")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
     return parser.parse_args()
 
 
+def service_unavailable(service):
+    """Answer 503 while a background connection from connect_services() is not up yet."""
+    return jsonify({
+        'status': 'error',
+        'message': f'{service} is not connected yet'
+    }), 503
+
+
+@app.route('/status', methods=['GET'])
+def status():
+    """Report startup timings and which background services are connected."""
+    return jsonify({
+        'status': 'success',
+        'startup': startup_times,
+        'lanes': [lane.status() for lane in lanes.values()],
+        'services': {
+            'mongodb': invoices_collection is not None,
+            'payment_gateway': payment_gateway is not None
+        }
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose pipeline, database and payment metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/create-order', methods=['POST'])
 def create_order():
+    """Create a Razorpay order for the server's own cart of a lane (data['lane'], default the first).
+
+    The amount is the cart's running total in paise and the line items come
+    from the same snapshot, which is journaled for /payment-success to
+    invoice. Any amount the client sends is ignored.
+    """
+    if payment_gateway is None:
+        return jsonify({'error': 'Payment gateway is still starting'}), 503
     try:
-        data = request.json
-        amount = int(float(data['amount']) * 100)  # Convert to paise
+        data = request.get_json(silent=True) or {}
+        lane = get_lane(data.get('lane'))
+        if lane is None:
+            return jsonify({'error': 'unknown lane'}), 404
+        snapshot = lane.cart.snapshot()
+        amount = snapshot['total_paise']
+        if amount <= 0:
+            return jsonify({'error': 'cart is empty'}), 400
         currency = "INR"
         
-        # Create Razorpay Order
-        payment_order = razorpay_client.order.create(dict(
-            amount=amount,
-            currency=currency,
-            payment_capture='1'
-        ))
+        # Create Razorpay Order, reusing a recent one for an identical cart
+        payment_order = payment_gateway.create_order(
+            amount, snapshot['products'], currency, lane.name, snapshot['seq']
+        )
+        invoice_journal.remember_order(payment_order['id'], lane.name, snapshot, PROCESS_RUN)
         
         return jsonify({
             'id': payment_order['id'],
             'amount': amount,
             'currency': currency,
+            'products': snapshot['products'],
             'key': os.getenv('RAZORPAY_KEY_ID')
         })
     except Exception as e:
@@ -481,52 +614,75 @@ def create_order():
 
 @app.route('/payment-success', methods=['POST'])
 def payment_success():
+    if payment_gateway is None:
+        return service_unavailable('Payment gateway')
     try:
         data = request.json
         print("Received payment success data:", data)
         
-        # Verify payment signature
-        params_dict = {
-            'razorpay_payment_id': data['razorpay_payment_id'],
-            'razorpay_order_id': data['razorpay_order_id'],
-            'razorpay_signature': data['razorpay_signature']
-        }
-        
-        razorpay_client.utility.verify_payment_signature(params_dict)
+        # Verify payment signature locally
+        payment_gateway.verify_payment_signature(
+            data['razorpay_order_id'],
+            data['razorpay_payment_id'],
+            data['razorpay_signature']
+        )
         print("Payment signature verified")
+
+        # A retried request for a payment already journaled gets the same answer again
+        if invoice_journal.has_payment(data['razorpay_payment_id']):
+            print(f"Invoice {data['razorpay_payment_id']} already journaled")
+            return jsonify({
+                'status': 'success',
+                'message': 'Payment successful and invoice stored',
+                'invoice_id': data['razorpay_payment_id']
+            })
+
+        # Invoice the cart snapshot the order was priced from; the client's copy is never billed
+        ordered = invoice_journal.order(data['razorpay_order_id'])
+        if ordered is None:
+            print(f"No priced cart for order {data['razorpay_order_id']}")
+            return jsonify({
+                'status': 'error',
+                'message': 'Unknown order; create a new order for the cart'
+            }), 409
+        lane_name, snapshot, run, _ = ordered
+        products = snapshot['products']
+        amount = snapshot['total_paise'] / 100
         
         # Store invoice in MongoDB with additional details
         invoice_data = {
             'order_id': data['razorpay_order_id'],
             'payment_id': data['razorpay_payment_id'],
-            'amount': data['amount'],
-            'products': data['products'],
+            'amount': amount,
+            'products': products,
             'timestamp': time.time(),
             'date': time.strftime('%Y-%m-%d'),
             'time': time.strftime('%H:%M:%S'),
             'status': 'paid',
             'payment_method': 'razorpay',
             'currency': 'INR',
-            'total_items': len(data['products']),
-            'total_amount': float(data['amount']),
+            'total_items': len(products),
+            'total_amount': amount,
             'payment_status': 'success',
             'transaction_id': data['razorpay_payment_id']
         }
         
-        print("Saving invoice data:", invoice_data)
-        
-        # Insert into MongoDB
-        result = invoices_collection.insert_one(invoice_data)
-        print(f"Invoice saved with ID: {result.inserted_id}")
-        
-        if result.inserted_id:
-            return jsonify({
-                'status': 'success',
-                'message': 'Payment successful and invoice stored',
-                'invoice_id': str(result.inserted_id)
-            })
+        # Journal locally (marking the order paid) and acknowledge; the flusher writes it to MongoDB
+        if invoice_journal.append(invoice_data):
+            print(f"Invoice {invoice_data['payment_id']} journaled")
         else:
-            raise Exception("Failed to store invoice in database")
+            print(f"Invoice {invoice_data['payment_id']} already journaled")
+
+        # The paid items leave the cart; a cart from before a restart is already gone
+        lane = lanes.get(lane_name)
+        if lane is not None and run == PROCESS_RUN:
+            lane.clear_cart(snapshot['products'])
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Payment successful and invoice stored',
+            'invoice_id': invoice_data['payment_id']
+        })
             
     except Exception as e:
         print(f"Error in payment success: {str(e)}")
@@ -535,26 +691,40 @@ def payment_success():
             'message': str(e)
         }), 500
 
+def expand_invoice(doc, fields=None):
+    """Stored invoice of any schema version in the shape /transactions has always returned."""
+    return expand(doc, product_ids, fields)
+
+
 @app.route('/transactions', methods=['GET'])
 def get_transactions():
+    """Return invoices newest first, one page at a time.
+
+    Query parameters: limit, cursor (the previous page's next_cursor), fields,
+    start_date/end_date and format=ndjson to stream every matching invoice.
+    """
+    if invoices_collection is None:
+        return service_unavailable('Database')
     try:
-        # Print debug information
-        print("Fetching transactions from MongoDB...")
-        print(f"MongoDB URI: {os.getenv('MONGODB_URI')}")
-        print(f"Database: {db.name}")
-        print(f"Collection: {invoices_collection.name}")
-        
-        # Fetch all transactions and print count
-        transactions = list(invoices_collection.find({}, {'_id': 0}).sort('timestamp', -1))
-        print(f"Found {len(transactions)} transactions")
-        
-        # Print first transaction if exists
-        if transactions:
-            print("Latest transaction:", transactions[0])
-        
+        query, fields, limit = build_query(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    try:
+        if request.args.get('format') == 'ndjson':
+            return Response(
+                stream_documents(invoices_collection, query, fields, expand_invoice, limit),
+                mimetype='application/x-ndjson'
+            )
+
+        transactions, next_cursor = fetch_page(invoices_collection, query, fields, limit, expand_invoice)
         return jsonify({
             'status': 'success',
-            'transactions': transactions
+            'transactions': transactions,
+            'next_cursor': next_cursor
         })
     except Exception as e:
         print(f"Error fetching transactions: {str(e)}")
@@ -563,34 +733,138 @@ def get_transactions():
             'message': str(e)
         }), 500
 
+@app.route('/analytics/daily', methods=['GET'])
+def analytics_daily():
+    """Return per-day revenue, invoice count, units and average basket from the rollups."""
+    if sales_analytics is None:
+        return service_unavailable('Database')
+    try:
+        days = sales_analytics.days(request.args.get('start_date'), request.args.get('end_date'))
+        return jsonify({
+            'status': 'success',
+            'days': days
+        })
+    except Exception as e:
+        print(f"Error fetching daily analytics: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/analytics/summary', methods=['GET'])
+def analytics_summary():
+    """Return the end-of-day numbers for ?date=YYYY-MM-DD, defaulting to today."""
+    if sales_analytics is None:
+        return service_unavailable('Database')
+    try:
+        summary = sales_analytics.day(request.args.get('date') or time.strftime('%Y-%m-%d'))
+        return jsonify({
+            'status': 'success',
+            'summary': summary
+        })
+    except Exception as e:
+        print(f"Error fetching analytics summary: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/analytics/products', methods=['GET'])
+def analytics_products():
+    """Return units and revenue per product over a date range from the rollups."""
+    if sales_analytics is None:
+        return service_unavailable('Database')
+    try:
+        products = sales_analytics.products(request.args.get('start_date'), request.args.get('end_date'))
+        return jsonify({
+            'status': 'success',
+            'products': products
+        })
+    except Exception as e:
+        print(f"Error fetching product analytics: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 if __name__ == "__main__":
     args = get_args()
 
-    # Initialize IMX500 and Picamera2
-    imx500 = IMX500(args.model)
-    imx500.show_network_fw_progress_bar()
-    picam2 = Picamera2()
-    config = picam2.create_video_configuration(
-        main={"size": (640, 480)},
-        lores={"size": (640, 480)},
-        controls={"FrameRate": args.fps}
-    )
-    picam2.pre_callback = pre_callback
+    # Build the category-indexed product catalog before any frame is decoded
+    catalog = Catalog(args.labels, args.products)
+    mark_startup('catalog')
+
+    # Open the invoice journal, then connect to MongoDB and Razorpay in the background
+    invoice_journal = InvoiceJournal(args.journal)
+    invoice_journal.start()
+    threading.Thread(target=connect_services, daemon=True).start()
+
+    # Reload product details whenever labels.txt or products.json change on disk
+    catalog.start_watching()
+
+    # Capture into shared memory and encode in worker processes, one per spare core; lanes share both
+    pool = None
+    if args.encode_workers > 0:
+        from frame_ring import FrameRing
+        from encode_pool import EncodePool
 
-    # Load product details (ensure products.json is updated accordingly)
-    with open(args.products, 'r') as f:
-        PRODUCTS = json.load(f)
+        frame_ring = FrameRing(args.lanes * (FRAME_QUEUE_SIZE + 2) + 2 * args.encode_workers)
+        pool = EncodePool(frame_ring, args.encode_workers, get_labels)
+        pool.start()
+        mark_startup('encode_pool')
 
-    # Start the camera
-    picam2.start(config, show_preview=True)
+    offload = None
+    if ASYNC_MODE == 'gevent':
+        # Drawing and JPEG encoding release the GIL; run them on real threads off the event loop
+        import gevent
+        offload = gevent.get_hub().threadpool.apply
 
-    # Start test detections if enabled
     if args.test_mode:
-        threading.Thread(target=add_test_detections, daemon=True).start()
         print("Running in test mode with fake detections")
 
-    # Start WebSocket emitter for updating dashboard
-    threading.Thread(target=emit_detections, daemon=True).start()
+    # Run detection on the CPU for cameras without an IMX500; all lanes share one batching engine
+    engine = None
+    if args.backend == 'cpu':
+        from cpu_inference import CpuDetector, InferenceEngine, InferenceSource
+
+        if args.source == 'picamera':
+            raise SystemExit("--backend cpu needs a video, images or synthetic source")
+        if not args.model:
+            raise SystemExit("--model is required for --backend cpu")
+        detector = CpuDetector(
+            args.model, args.cpu_runtime, args.cpu_format,
+            (args.input_size, args.input_size) if args.input_size else None
+        )
+        engine = InferenceEngine(detector, args.batch_size, workers=args.inference_threads or None)
+        engine.start()
+        mark_startup('inference_engine')
+
+    # One lane per camera: its own detections, tracker, cart, MJPEG hub and Socket.IO room
+    for number in range(args.lanes):
+        name = str(number + 1)
+        source = create_frame_source(args, number)
+        if engine is not None:
+            source = InferenceSource(source, engine, depth=args.batch_size)
+        # Always-on record of what the lane saw and charged, for disputes
+        recorder = None
+        if args.flight_dir:
+            recorder = FlightRecorder(os.path.join(args.flight_dir, f'lane-{name}.bin'), args.flight_records)
+        lanes[name] = Lane(
+            name, source, catalog, socketio, renderers, args.threshold,
+            # Skip decode, drawing and encoding while nothing on the counter moves
+            motion_gate=None if args.no_motion_gate else MotionGate(args.motion_threshold),
+            ring=frame_ring, pool=pool, offload=offload, recorder=recorder, on_first_frame=mark_first_frame
+        )
+        if engine is not None:
+            # Gate before inference, so static frames cost no model run either
+            source.gate = lanes[name].frame_moving
+        lanes[name].start(args.test_mode)
+    mark_startup('frame_source')
 
     # Run Flask app with Socket.IO
-    socketio.run(app, host='0.0.0.0', port=5000)
+    mark_startup('server')
+    print(f"Serving on {args.host}:{args.port} in {ASYNC_MODE} mode")
+    if ASYNC_MODE == 'gevent':
+        socketio.run(app, host=args.host, port=args.port)
+    else:
+        socketio.run(app, host=args.host, port=args.port, allow_unsafe_werkzeug=True)
@@ -0,0 +1,137 @@
+"""Benchmark the CPU inference backend on a plain Linux box.
+
+Runs a detection model through the batching InferenceEngine for every
+combination of source count and batch size, each source keeping a batch
+worth of frames in flight as InferenceSource does, and reports frames per
+second, per-frame latency percentiles (submit to outputs), average batch
+fill and process CPU. Example:
+
+    python bench_inference.py --model ssd_mobilenet_v2.onnx --sources 1,2,4 --batch-sizes 1,4,8
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import Timed, load_frames, percentiles
+from cpu_inference import CpuDetector, InferenceEngine
+
+
+def produce(engine, frames, depth, deadline, fps, latencies, lock):
+    """Submit frames until deadline with up to depth in flight; return how many completed."""
+    in_flight = deque()
+    completed = 0
+    sent = 0
+    start = time.perf_counter()
+    interval = 1.0 / fps if fps else 0
+    while time.perf_counter() < deadline:
+        if len(in_flight) >= depth:
+            submitted, future = in_flight.popleft()
+            future.result()
+            with lock:
+                latencies.append(time.perf_counter() - submitted)
+            completed += 1
+        in_flight.append((time.perf_counter(), engine.submit(frames[sent % len(frames)])))
+        sent += 1
+        if interval:
+            time.sleep(max(0.0, start + sent * interval - time.perf_counter()))
+    for _, future in in_flight:
+        future.result()
+    return completed
+
+
+def run_scenario(detector, frames, sources, batch_size, workers, duration, fps):
+    batches = []
+    detector.infer = Timed(detector.infer.fn, batches)
+    engine = InferenceEngine(detector, batch_size, workers=workers)
+    engine.start()
+    # Warm up so model loading and first-run allocation are not measured
+    engine.submit(frames[0]).result()
+    batches.clear()
+
+    latencies = []
+    lock = threading.Lock()
+    counts = [0] * sources
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        counts[index] = produce(engine, frames, batch_size, deadline, fps, latencies, lock)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(sources)]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    engine.stop()
+
+    return {
+        'sources': sources,
+        'batch_size': batch_size,
+        'workers': engine.workers,
+        'fps': round(sum(counts) / elapsed, 2),
+        'fps_per_source': round(min(counts) / elapsed, 2),
+        'mean_batch': round(sum(counts) / len(batches), 2) if batches else None,
+        'cpu_percent': round(cpu / elapsed * 100, 1),
+        'latency': percentiles(latencies),
+        'batch': percentiles(batches),
+    }
+
+
+def print_report(report):
+    print(f"{report['model']} ({report['runtime']}, input {report['input_size']})")
+    for s in report['scenarios']:
+        latency = s['latency']
+        print(f"  {s['sources']} sources, batch {s['batch_size']:>2}, {s['workers']} workers: "
+              f"{s['fps']:>7} fps ({s['fps_per_source']} per source), mean batch {s['mean_batch']}, "
+              f"latency p50 {latency['p50_ms']} ms p95 {latency['p95_ms']} ms, {s['cpu_percent']}% CPU")
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark CPU detection throughput and latency")
+    parser.add_argument("--model", type=str, required=True, help="ONNX or OpenCV DNN detection model")
+    parser.add_argument("--cpu-runtime", choices=["auto", "onnxruntime", "opencv"], default="auto", help="Runtime")
+    parser.add_argument("--cpu-format", choices=["ssd", "yolo"], default="ssd", help="Model output layout")
+    parser.add_argument("--input-size", type=int, help="Square input size for models with dynamic axes")
+    parser.add_argument("--frames", type=str, help="Directory of recorded frames (default: synthetic)")
+    parser.add_argument("--sources", type=str, default="1,2,4", help="Concurrent frame sources to test")
+    parser.add_argument("--batch-sizes", type=str, default="1,4,8", help="Batch sizes to test")
+    parser.add_argument("--workers", type=int, default=0, help="Batches run at once (0 = engine default)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per scenario")
+    parser.add_argument("--fps", type=float, default=0, help="Frame rate per source (0 = as fast as possible)")
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    detector = CpuDetector(
+        args.model, args.cpu_runtime, args.cpu_format,
+        (args.input_size, args.input_size) if args.input_size else None
+    )
+    detector.infer = Timed(detector.infer, [])
+    frames = load_frames(args.frames, 30)
+    report = {
+        'model': args.model,
+        'runtime': detector.runtime,
+        'input_size': list(detector.input_size),
+        'cpu_count': os.cpu_count(),
+        'scenarios': [
+            run_scenario(detector, frames, int(sources), int(batch_size), args.workers or None, args.duration, args.fps)
+            for sources in args.sources.split(',')
+            for batch_size in args.batch_sizes.split(',')
+        ],
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
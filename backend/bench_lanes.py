@@ -0,0 +1,149 @@
+"""Benchmark how the checkout engine scales as lanes are added to one process.
+
+Starts lanes one step at a time, each with its own synthetic camera, cart
+and /video_feed viewer, and after every step measures each lane's input,
+cart and stream fps against the target rate, plus process CPU. It also
+checks that lanes stay isolated: every cart_delta must reach only its own
+lane's room, once per change to that lane's cart. Example:
+
+    python bench_lanes.py --labels ../frontend/assets/labels.txt \\
+        --products ../frontend/products.json --lanes 1,2,4,8
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import Viewer
+from frame_sources import SyntheticSource, synthetic_frames
+
+
+class RoomRecorder:
+    def __init__(self):
+        """Stand-in for socketio.emit counting cart_delta events per room."""
+        self.deltas = Counter()
+        self._lock = threading.Lock()
+
+    def emit(self, event, data=None, to=None, **kwargs):
+        if event == 'cart_delta':
+            with self._lock:
+                self.deltas[to] += 1
+
+
+def add_lane(app, lanes, args, pool, ring):
+    from lane import Lane
+    from motion import MotionGate
+
+    number = len(lanes)
+    name = str(number + 1)
+    source = SyntheticSource(args.fps, args.detections, len(app.catalog.index), synthetic_frames(30, seed=number))
+    lane = Lane(
+        name, source, app.catalog, app.socketio, app.renderers, args.threshold,
+        motion_gate=MotionGate() if args.motion_gate else None, ring=ring, pool=pool
+    )
+    # The frame hub has to be running before a viewer subscribes, or the stream stays empty
+    lane.start()
+    lanes.append((lane, Viewer(lane.generate_frames(overlay=True))))
+    lane.start_detection()
+
+
+def measure(lanes, recorder, duration, fps):
+    """Run every lane for duration seconds and return the step's report."""
+    before = [(lane.frames_total.value, lane.cart_updates.value, viewer.frames) for lane, viewer in lanes]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    per_lane = []
+    for (lane, viewer), (frames, updates, streamed) in zip(lanes, before):
+        per_lane.append({
+            'lane': lane.name,
+            'input_fps': round((lane.frames_total.value - frames) / elapsed, 2),
+            'cart_fps': round((lane.cart_updates.value - updates) / elapsed, 2),
+            'stream_fps': round((viewer.frames - streamed) / elapsed, 2),
+            'cart_seq': lane.cart.seq,
+            'cart_deltas': recorder.deltas[lane.room],
+        })
+        # A lane that streamed nothing would make every stream figure meaningless
+        assert viewer.frames > streamed, f"lane {lane.name} streamed no frames in {duration}s"
+    rooms = {lane.room for lane, _ in lanes}
+    total_input = sum(lane['input_fps'] for lane in per_lane)
+    return {
+        'lanes': len(lanes),
+        'aggregate_input_fps': round(total_input, 2),
+        'aggregate_stream_fps': round(sum(lane['stream_fps'] for lane in per_lane), 2),
+        'min_lane_input_fps': min(lane['input_fps'] for lane in per_lane),
+        'efficiency': round(total_input / (len(lanes) * fps), 3) if fps else None,
+        'cpu_percent': round(cpu / elapsed * 100, 1),
+        'cpu_percent_per_lane': round(cpu / elapsed * 100 / len(lanes), 1),
+        # Deltas sent to a room no lane owns, or more than a lane's cart changed, would be leaks
+        'isolated': all(lane['cart_deltas'] <= lane['cart_seq'] for lane in per_lane)
+                    and set(recorder.deltas) <= rooms,
+        'per_lane': per_lane,
+    }
+
+
+def print_report(report):
+    for step in report['steps']:
+        print(f"\n{step['lanes']} lanes: {step['aggregate_input_fps']} fps in, "
+              f"{step['aggregate_stream_fps']} fps streamed, slowest lane {step['min_lane_input_fps']} fps, "
+              f"efficiency {step['efficiency']}, {step['cpu_percent']}% CPU "
+              f"({step['cpu_percent_per_lane']}%/lane), isolated: {step['isolated']}")
+        for lane in step['per_lane']:
+            print(f"  lane {lane['lane']:<3} input {lane['input_fps']:>6} fps  cart {lane['cart_fps']:>6} fps  "
+                  f"stream {lane['stream_fps']:>6} fps  {lane['cart_deltas']} deltas")
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark checkout throughput as lanes are added")
+    parser.add_argument("--labels", type=str, default="assets/labels.txt", help="Path to labels file")
+    parser.add_argument("--products", type=str, default="products.json", help="Path to product details JSON")
+    parser.add_argument("--lanes", type=str, default="1,2,4", help="Lane counts to measure, ascending")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to measure per lane count")
+    parser.add_argument("--fps", type=int, default=15, help="Frame rate of each lane's synthetic camera")
+    parser.add_argument("--detections", type=int, default=3, help="Synthetic objects per frame")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Detection threshold")
+    parser.add_argument("--motion-gate", action="store_true", help="Skip static frames as the app does")
+    parser.add_argument("--encode-workers", type=int, default=0, help="Encode in this many shared worker processes")
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    counts = sorted(int(count) for count in args.lanes.split(','))
+
+    import app_new17 as app
+    from lane import FRAME_QUEUE_SIZE
+
+    app.catalog = app.Catalog(args.labels, args.products)
+    recorder = RoomRecorder()
+    app.socketio.emit = recorder.emit
+    ring = pool = None
+    if args.encode_workers > 0:
+        from frame_ring import FrameRing
+        from encode_pool import EncodePool
+
+        ring = FrameRing(counts[-1] * (FRAME_QUEUE_SIZE + 2) + 2 * args.encode_workers)
+        pool = EncodePool(ring, args.encode_workers, app.get_labels)
+        pool.start()
+
+    lanes = []
+    report = {'fps_per_lane': args.fps, 'steps': []}
+    for count in counts:
+        while len(lanes) < count:
+            add_lane(app, lanes, args, pool, ring)
+        time.sleep(1.0)  # Let the new lanes reach their frame rate before measuring
+        report['steps'].append(measure(lanes, recorder, args.duration, args.fps))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,258 @@
+"""Headless benchmark of the checkout pipeline driven by synthetic IMX500 outputs.
+
+Feeds generated (or recorded) frames and output tensors through one Lane's
+pre_callback, emit_detections cart consumer and MJPEG stream on any
+Linux box, then reports per-stage latency percentiles, sustained fps, frames
+dropped at frame_queue, process CPU and memory per frame. --static repeats one
+frame and --motion-gate enables the scene-change gate, so together they show
+what the gate saves while nothing moves. --encode-workers moves drawing and
+encoding into worker processes fed from shared memory, as in the app; the
+overlay_draw and jpeg_encode stages are then not timed, but stream fps shows
+how throughput scales with workers. Example:
+
+    python bench_pipeline.py --labels ../frontend/assets/labels.txt \\
+        --products ../frontend/products.json --json bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import frame_hub as frame_hub_module
+from frame_sources import ImageDirectorySource, Scene, SourceFrame, SyntheticSource, synthetic_frames
+
+
+def load_frames(directory, count):
+    """Load recorded frames from a directory, or generate textured synthetic ones."""
+    frames = []
+    if directory:
+        source = ImageDirectorySource(directory, loop=False)
+        for index in range(min(count, len(source.paths))):
+            frames.append(source.read(index).frame)
+    return frames or synthetic_frames(count)
+
+
+class Timed:
+    def __init__(self, fn, samples):
+        """Wrap fn so each call's duration is appended to samples."""
+        self.fn = fn
+        self.samples = samples
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.samples.append(time.perf_counter() - start)
+
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'count': len(samples), 'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3)}
+
+
+class Viewer:
+    def __init__(self, generator):
+        """Consume an MJPEG generator in the background, counting delivered frames."""
+        self.frames = 0
+        self.generator = generator
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        for _ in self.generator:
+            self.frames += 1
+
+
+def run_scenario(lane, frames, count, duration, fps, viewers):
+    """Drive one detections-per-frame scenario and return its report."""
+    scene = Scene(count, len(lane.catalog.index))
+    stages = {'pre_callback': [], 'cart_update': [], 'overlay_draw': [], 'jpeg_encode': []}
+    lane.tracker.update = Timed(lane.tracker.update.fn, stages['cart_update'])
+    for channel in lane.frame_hub.channels.values():
+        if channel.render is not None:
+            channel.render = Timed(channel.render.fn, stages['overlay_draw'])
+    frame_hub_module.encode_jpeg = Timed(frame_hub_module.encode_jpeg.fn, stages['jpeg_encode'])
+    lane.tracker.reset()
+    lane.cart.clear()
+    while not lane.frame_queue.empty():
+        frame = lane.frame_queue.get_nowait()[0]
+        if lane.ring is not None:
+            lane.ring.release_frame(frame)
+    delivered_before = [viewer.frames for viewer in viewers]
+
+    dropped = 0
+    sent = 0
+    static_before = lane.static_frames.value
+    interval = 1.0 / fps if fps else 0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        request = SourceFrame(frames[sent % len(frames)], outputs=scene.outputs(sent))
+        if lane.frame_queue.full():
+            dropped += 1
+        t0 = time.perf_counter()
+        lane.pre_callback(request)
+        stages['pre_callback'].append(time.perf_counter() - t0)
+        sent += 1
+        if interval:
+            time.sleep(max(0.0, start + sent * interval - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    static = lane.static_frames.value - static_before
+    time.sleep(0.2)  # Let the consumers drain the last frames
+    # Snapshot the timed run before the memory pass adds frames, cart updates and stage samples of its own
+    streamed = [viewer.frames - before for viewer, before in zip(viewers, delivered_before)]
+    cart_updates = len(stages['cart_update'])
+    cart_lines = len(lane.cart.snapshot()['products'])
+    stage_report = {name: percentiles(samples) for name, samples in stages.items()}
+
+    # Memory pass: allocation peak per pre_callback and growth retained per frame
+    tracemalloc.start()
+    base_current, _ = tracemalloc.get_traced_memory()
+    peaks = []
+    for i in range(50):
+        request = SourceFrame(frames[i % len(frames)], outputs=scene.outputs(sent + i))
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        lane.pre_callback(request)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    time.sleep(0.2)
+    end_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'detections_per_frame': count,
+        'frames': sent,
+        'input_fps': round(sent / elapsed, 2),
+        'cart_fps': round(cart_updates / elapsed, 2),
+        'stream_fps': round(min(streamed) / elapsed, 2) if streamed else None,
+        'frame_queue_drops': dropped,
+        'static_frames': static,
+        'cpu_percent': round(cpu / elapsed * 100, 1),
+        'cart_lines': cart_lines,
+        'memory_peak_kb_per_frame': round(float(np.mean(peaks)) / 1024, 1),
+        'memory_retained_kb_per_frame': round((end_current - base_current) / 50 / 1024, 2),
+        'stages': stage_report,
+    }
+
+
+def load_lane(args):
+    """Build a Lane over a synthetic frame source with no external services."""
+    import app_new17 as app
+    from lane import FRAME_QUEUE_SIZE, Lane
+    from motion import MotionGate
+
+    app.catalog = app.Catalog(args.labels, args.products)
+    app.socketio.emit = lambda *a, **k: None
+    frame_hub_module.encode_jpeg = Timed(frame_hub_module.encode_jpeg, [])
+    ring = pool = None
+    if args.encode_workers > 0:
+        from frame_ring import FrameRing
+        from encode_pool import EncodePool
+
+        ring = FrameRing(FRAME_QUEUE_SIZE + 2 * args.encode_workers + 2)
+        pool = EncodePool(ring, args.encode_workers, app.get_labels)
+        pool.start()
+    # Frames are pushed by run_scenario, so the source itself is never started
+    lane = Lane(
+        'bench', SyntheticSource(num_labels=len(app.catalog.index)), app.catalog, app.socketio, app.renderers,
+        args.threshold, motion_gate=MotionGate() if args.motion_gate else None, ring=ring, pool=pool
+    )
+    lane.tracker.update = Timed(lane.tracker.update, [])
+    for channel in lane.frame_hub.channels.values():
+        if channel.render is not None:
+            channel.render = Timed(channel.render, [])
+    lane.detection_active = True
+    lane.frame_hub.start()
+    threading.Thread(target=lane.emit_detections, daemon=True).start()
+    return lane
+
+
+def compare(report, baseline, tolerance):
+    """Return stage p95 regressions beyond tolerance relative to a baseline report."""
+    regressions = []
+    previous = {s['detections_per_frame']: s for s in baseline.get('scenarios', [])}
+    for scenario in report['scenarios']:
+        old = previous.get(scenario['detections_per_frame'])
+        if old is None:
+            continue
+        for stage, stats in scenario['stages'].items():
+            old_p95 = old['stages'].get(stage, {}).get('p95_ms')
+            if stats['p95_ms'] and old_p95 and stats['p95_ms'] > old_p95 * (1 + tolerance):
+                regressions.append(
+                    f"{scenario['detections_per_frame']} detections: {stage} p95 "
+                    f"{old_p95:.3f} -> {stats['p95_ms']:.3f} ms"
+                )
+    return regressions
+
+
+def print_report(report):
+    for s in report['scenarios']:
+        print(f"\n{s['detections_per_frame']} detections/frame: {s['frames']} frames, "
+              f"input {s['input_fps']} fps, cart {s['cart_fps']} fps, stream {s['stream_fps']} fps, "
+              f"{s['frame_queue_drops']} dropped at frame_queue, {s['static_frames']} static, "
+              f"{s['cpu_percent']}% CPU")
+        print(f"  memory: {s['memory_peak_kb_per_frame']} KB peak/frame, "
+              f"{s['memory_retained_kb_per_frame']} KB retained/frame")
+        for stage, stats in s['stages'].items():
+            if stats['count']:
+                print(f"  {stage:<14} p50 {stats['p50_ms']:>8.3f} ms  p95 {stats['p95_ms']:>8.3f} ms  "
+                      f"p99 {stats['p99_ms']:>8.3f} ms  (n={stats['count']})")
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the checkout pipeline without a camera")
+    parser.add_argument("--labels", type=str, default="assets/labels.txt", help="Path to labels file")
+    parser.add_argument("--products", type=str, default="products.json", help="Path to product details JSON")
+    parser.add_argument("--frames", type=str, help="Directory of recorded frames (default: synthetic)")
+    parser.add_argument("--scenarios", type=str, default="0,1,10,100", help="Detections per frame to test")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per scenario")
+    parser.add_argument("--fps", type=float, default=0, help="Input frame rate (0 = as fast as possible)")
+    parser.add_argument("--viewers", type=int, default=1, help="Concurrent /video_feed viewers")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Detection threshold")
+    parser.add_argument("--motion-gate", action="store_true", help="Skip static frames as the app does")
+    parser.add_argument("--static", action="store_true", help="Repeat a single frame, as for an empty counter")
+    parser.add_argument("--encode-workers", type=int, default=0, help="Encode in this many worker processes")
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+    parser.add_argument("--baseline", type=str, help="Fail if p95 latencies regress against this report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 regression ratio")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    lane = load_lane(args)
+    frames = load_frames(args.frames, 30)
+    if args.static:
+        frames = frames[:1]
+    viewers = [Viewer(lane.generate_frames(overlay=True)) for _ in range(args.viewers)]
+    report = {
+        'scenarios': [
+            run_scenario(lane, frames, int(count), args.duration, args.fps, viewers)
+            for count in args.scenarios.split(',')
+        ]
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        sys.exit(1 if regressions else 0)
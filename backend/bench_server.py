@@ -0,0 +1,289 @@
+"""Load test for app_new17 in its threading and gevent server modes.
+
+Starts the app with the synthetic frame source once per mode, opens many
+concurrent /video_feed viewers and Socket.IO dashboard clients, and reports
+delivered fps per viewer, cart broadcast latency, connection success and
+server CPU, memory and thread counts. --slow-sockets adds dashboards that
+take --slow-delay seconds to handle each update, to check they do not hold
+up the others. Example:
+
+    python bench_server.py --labels ../frontend/assets/labels.txt \\
+        --products ../frontend/products.json --viewers 200 --sockets 200
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BOUNDARY = b'--frame'
+
+
+class MjpegViewer:
+    def __init__(self, port, path='/video_feed'):
+        """Hold one /video_feed connection open and count the frames it delivers."""
+        self.port = port
+        self.path = path
+        self.frames = 0
+        self.connected = False
+        self.error = None
+        self.first_frame = None
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+            conn.request('GET', self.path)
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            self.connected = True
+            tail = b''
+            while self._running:
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+                data = tail + chunk
+                found = data.count(BOUNDARY)
+                if found and self.first_frame is None:
+                    self.first_frame = time.perf_counter() - start
+                self.frames += found
+                # Keep enough bytes to catch a boundary split across reads
+                tail = data[-(len(BOUNDARY) - 1):]
+            conn.close()
+        except Exception as e:
+            self.error = str(e)
+
+
+class DashboardClient:
+    def __init__(self, port, delay=0.0):
+        """A Socket.IO client counting the cart updates the dashboard would receive.
+
+        Returning from the handler acknowledges the update, after delay seconds.
+        """
+        import socketio
+
+        self.updates = 0
+        self.latencies = []
+        self.delay = delay
+        self.connect_time = None
+        self.error = None
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('detection_update', self._on_update)
+        self.port = port
+
+    def _on_update(self, data):
+        self.updates += 1
+        if isinstance(data, dict) and 'published_at' in data:
+            self.latencies.append(time.time() - data['published_at'])
+        if self.delay:
+            time.sleep(self.delay)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            self.client.connect(f'http://127.0.0.1:{self.port}', transports=['websocket'], wait_timeout=10)
+            self.connect_time = time.perf_counter() - start
+        except Exception as e:
+            self.error = str(e)
+
+    def disconnect(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+class ProcessSampler:
+    def __init__(self, pid, interval=0.5):
+        """Sample a process's CPU percentage, resident memory and thread count."""
+        import psutil
+
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self.threads = []
+        self._running = True
+        self.process.cpu_percent(None)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            try:
+                self.cpu.append(self.process.cpu_percent(None))
+                self.rss.append(self.process.memory_info().rss)
+                self.threads.append(self.process.num_threads())
+            except Exception:
+                return
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/status')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def start_server(args, mode, port, journal):
+    command = [
+        sys.executable, os.path.join(HERE, 'app_new17.py'),
+        '--source', 'synthetic', '--synthetic-detections', str(args.detections),
+        '--fps', str(args.fps), '--server', mode, '--port', str(port), '--host', '127.0.0.1',
+        '--labels', args.labels, '--products', args.products, '--journal', journal,
+        '--flight-dir', os.path.join(os.path.dirname(journal), 'flight'),
+        # Load the full pipeline on every frame; the gate would skip most of them
+        '--no-motion-gate',
+    ]
+    # An unreachable MongoDB keeps the load on the streaming and Socket.IO paths only
+    env = dict(os.environ, MONGODB_URI='mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=200')
+    return subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_mode(args, mode, port):
+    """Load one server mode and return its report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(args, mode, port, os.path.join(tmp, 'invoices.db'))
+        try:
+            if not wait_for_server(port):
+                return {'mode': mode, 'error': 'server did not start'}
+            sampler = ProcessSampler(server.pid)
+
+            dashboards = [DashboardClient(port) for _ in range(args.sockets)]
+            slow = [DashboardClient(port, args.slow_delay) for _ in range(args.slow_sockets)]
+            dashboards += slow
+            connectors = [threading.Thread(target=d.connect, daemon=True) for d in dashboards]
+            for thread in connectors:
+                thread.start()
+            viewers = []
+            for _ in range(args.viewers):
+                viewers.append(MjpegViewer(port))
+                time.sleep(args.ramp / max(args.viewers, 1))
+            deadline = time.time() + 15
+            for thread in connectors:
+                thread.join(max(0.0, deadline - time.time()))
+            connected = [d for d in dashboards if d.connect_time is not None]
+            if connected:
+                connected[0].client.emit('start_detection')
+
+            time.sleep(2)  # Let every viewer reach steady state before measuring
+            frames_before = [v.frames for v in viewers]
+            updates_before = sum(d.updates for d in dashboards)
+            for dashboard in dashboards:
+                dashboard.latencies.clear()
+            sampler.cpu.clear()
+            start = time.perf_counter()
+            time.sleep(args.duration)
+            elapsed = time.perf_counter() - start
+            fps = np.array([v.frames - before for v, before in zip(viewers, frames_before)]) / elapsed
+            updates = sum(d.updates for d in dashboards) - updates_before
+            latencies = np.array([
+                latency for d in dashboards if d.delay == 0 for latency in d.latencies
+            ]) * 1000
+            sampler.stop()
+
+            for viewer in viewers:
+                viewer.stop()
+            for dashboard in connected:
+                dashboard.disconnect()
+
+            connect_times = np.array([d.connect_time for d in connected]) * 1000
+            first_frames = np.array([v.first_frame for v in viewers if v.first_frame is not None]) * 1000
+            return {
+                'mode': mode,
+                'viewers': args.viewers,
+                'viewers_streaming': int(np.count_nonzero(fps > 0)),
+                'viewer_fps_mean': round(float(fps.mean()), 2) if len(fps) else None,
+                'viewer_fps_p5': round(float(np.percentile(fps, 5)), 2) if len(fps) else None,
+                'first_frame_p95_ms': round(float(np.percentile(first_frames, 95)), 1) if len(first_frames) else None,
+                'sockets': len(dashboards),
+                'sockets_connected': len(connected),
+                'socket_connect_p95_ms': round(float(np.percentile(connect_times, 95)), 1) if len(connect_times) else None,
+                'socket_updates_per_s': round(updates / elapsed, 1),
+                'broadcast_latency_p50_ms': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+                'broadcast_latency_p95_ms': round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+                'slow_sockets': args.slow_sockets,
+                'slow_socket_updates': sum(d.updates for d in slow),
+                'server_cpu_percent': round(float(np.mean(sampler.cpu)), 1) if sampler.cpu else None,
+                'server_rss_mb': round(max(sampler.rss) / 2 ** 20, 1) if sampler.rss else None,
+                'server_threads': max(sampler.threads) if sampler.threads else None,
+            }
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+def print_report(report):
+    for r in report['modes']:
+        if 'error' in r:
+            print(f"\n{r['mode']}: {r['error']}")
+            continue
+        print(f"\n{r['mode']}:")
+        print(f"  viewers   {r['viewers_streaming']}/{r['viewers']} streaming, "
+              f"{r['viewer_fps_mean']} fps mean, {r['viewer_fps_p5']} fps p5, "
+              f"first frame p95 {r['first_frame_p95_ms']} ms")
+        print(f"  sockets   {r['sockets_connected']}/{r['sockets']} connected, "
+              f"connect p95 {r['socket_connect_p95_ms']} ms, {r['socket_updates_per_s']} updates/s")
+        print(f"  broadcast latency p50 {r['broadcast_latency_p50_ms']} ms, p95 {r['broadcast_latency_p95_ms']} ms; "
+              f"{r['slow_sockets']} slow sockets got {r['slow_socket_updates']} updates")
+        print(f"  server    {r['server_cpu_percent']}% CPU, {r['server_rss_mb']} MB RSS, "
+              f"{r['server_threads']} threads")
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Compare the app's server modes under many concurrent clients")
+    parser.add_argument("--labels", type=str, default="assets/labels.txt", help="Path to labels file")
+    parser.add_argument("--products", type=str, default="products.json", help="Path to product details JSON")
+    parser.add_argument("--modes", type=str, default="threading,gevent", help="Server modes to compare")
+    parser.add_argument("--viewers", type=int, default=100, help="Concurrent /video_feed viewers")
+    parser.add_argument("--sockets", type=int, default=100, help="Concurrent Socket.IO dashboard clients")
+    parser.add_argument("--slow-sockets", type=int, default=0, help="Extra dashboard clients that handle updates slowly")
+    parser.add_argument("--slow-delay", type=float, default=5.0, help="Seconds a slow client spends per update")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to measure per mode")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which viewers connect")
+    parser.add_argument("--fps", type=int, default=15, help="Synthetic source frame rate")
+    parser.add_argument("--detections", type=int, default=3, help="Synthetic objects per frame")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the server under test")
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    args.labels = os.path.abspath(args.labels)
+    args.products = os.path.abspath(args.products)
+    report = {'modes': [run_mode(args, mode, args.port + i) for i, mode in enumerate(args.modes.split(','))]}
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
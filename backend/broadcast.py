@@ -0,0 +1,128 @@
+import threading
+import time
+
+from metrics import REGISTRY
+
+SENT = REGISTRY.counter('checkout_broadcast_sent_total', 'Cart snapshots sent to dashboard clients')
+COALESCED = REGISTRY.counter(
+    'checkout_broadcast_coalesced_total', 'Cart snapshots a client never got because a newer one replaced them'
+)
+ACK_TIMEOUTS = REGISTRY.counter(
+    'checkout_broadcast_ack_timeouts_total', 'Snapshots resent after a client failed to acknowledge in time'
+)
+ACK_SECONDS = REGISTRY.histogram('checkout_broadcast_ack_seconds', 'Time from sending a snapshot to its acknowledgement')
+
+
+class Client:
+    __slots__ = ('sid', 'version', 'in_flight', 'sent_at')
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.version = 0  # Last snapshot version sent
+        self.in_flight = False
+        self.sent_at = 0.0
+
+
+class Broadcaster:
+    def __init__(self, socketio, event, ack_timeout=2.0, min_interval=0.05, lane=None):
+        """Latest-value fan-out of one event to every connected client, paced by each client.
+
+        publish() only replaces the latest payload. A sender thread gives each
+        client at most one unacknowledged copy: a client still busy with the
+        previous one is skipped, and gets whatever is newest once it acks, so
+        intermediate payloads are dropped for slow clients instead of queued.
+        A client that has not acked within ack_timeout is sent the newest
+        payload anyway, and clients that never ack (older dashboards) still
+        receive an update every ack_timeout. Rounds run at most every
+        min_interval, coalescing bursts for everyone. lane, if given, labels
+        the client gauge.
+        """
+        self.socketio = socketio
+        self.event = event
+        self.ack_timeout = ack_timeout
+        self.min_interval = min_interval
+        self.clients = {}
+        self.payload = None
+        self.version = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        labels = {'lane': lane} if lane is not None else {}
+        REGISTRY.gauge('checkout_broadcast_clients', 'Connected dashboard clients', read=lambda: len(self.clients), **labels)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, sid):
+        """Register a client; it is sent the current payload on the next round."""
+        with self._cond:
+            self.clients[sid] = Client(sid)
+            self._cond.notify()
+
+    def remove(self, sid):
+        with self._cond:
+            self.clients.pop(sid, None)
+
+    def publish(self, payload):
+        with self._cond:
+            self.payload = payload
+            self.version += 1
+            self._cond.notify()
+
+    def _ack(self, sid, version):
+        with self._cond:
+            client = self.clients.get(sid)
+            if client is None or client.version != version or not client.in_flight:
+                return
+            client.in_flight = False
+            ACK_SECONDS.observe(time.perf_counter() - client.sent_at)
+            if client.version < self.version:
+                self._cond.notify()
+
+    def _due(self, now):
+        """Clients to send to now, and when the next in-flight copy times out."""
+        due = []
+        next_timeout = None
+        for client in self.clients.values():
+            if client.version >= self.version:
+                continue
+            if client.in_flight:
+                expires = client.sent_at + self.ack_timeout
+                if expires > now:
+                    next_timeout = expires if next_timeout is None else min(next_timeout, expires)
+                    continue
+                ACK_TIMEOUTS.inc()
+            due.append(client)
+        return due, next_timeout
+
+    def _run(self):
+        last_round = 0.0
+        while True:
+            with self._cond:
+                while True:
+                    now = time.perf_counter()
+                    due, next_timeout = self._due(now) if self.payload is not None else ([], None)
+                    if due:
+                        break
+                    self._cond.wait(None if next_timeout is None else next_timeout - now)
+                payload, version = self.payload, self.version
+                for client in due:
+                    if client.version and version - client.version > 1:
+                        COALESCED.inc(version - client.version - 1)
+                    client.version = version
+                    client.in_flight = True
+                    client.sent_at = now
+            for client in due:
+                try:
+                    self.socketio.emit(
+                        self.event, payload, to=client.sid,
+                        callback=lambda *args, sid=client.sid, v=version: self._ack(sid, v)
+                    )
+                    SENT.inc()
+                except Exception as e:
+                    print(f"Error sending {self.event} to {client.sid}: {e}")
+            # Pace rounds so a burst of publishes goes out as one
+            pause = last_round + self.min_interval - time.perf_counter()
+            last_round = time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
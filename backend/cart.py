@@ -0,0 +1,100 @@
+import threading
+from collections import deque
+
+
+class Cart:
+    def __init__(self, history=1000):
+        """Cart contents plus a sequence-numbered log of the changes made to it.
+
+        Every change produces a delta {'seq', 'op', 'item', 'total_paise'}
+        holding the item's state and the cart total after the change, so
+        deltas can be replayed idempotently by a client that reconnects. The
+        last `history` deltas are kept. The total is kept in integer paise and
+        updated with each change, so reading it never re-adds the lines.
+        """
+        self.items = []
+        self._lines = {}  # label -> cart line
+        self.seq = 0
+        self.total_paise = 0
+        self._log = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def add(self, entry, quantity=1):
+        """Add quantity of a CatalogEntry and return the resulting delta.
+
+        Lines are found by label, not category, because a catalog reload can
+        give a product a different category while it is in the cart.
+        """
+        with self._lock:
+            item = self._lines.get(entry.label)
+            if item is None:
+                item = {'name': entry.label, 'quantity': quantity, 'price': entry.price,
+                        'price_paise': entry.price_paise}
+                self.items.append(item)
+                self._lines[entry.label] = item
+                op = 'add'
+            else:
+                item['quantity'] += quantity
+                op = 'update'
+            # A line keeps the price it was first added at, even if the catalog changes
+            self.total_paise += quantity * item['price_paise']
+            return self._record(op, dict(item))
+
+    def clear(self):
+        """Empty the cart and return the resulting delta."""
+        with self._lock:
+            self.items = []
+            self._lines = {}
+            self.total_paise = 0
+            return self._record('clear', None)
+
+    def remove_paid(self, products):
+        """Take the lines of a paid snapshot out of the cart and return the resulting deltas.
+
+        Anything added since the snapshot was taken stays in the cart: each
+        line only loses the quantity that was paid for, and is removed once
+        none of it is left.
+        """
+        deltas = []
+        with self._lock:
+            for paid in products:
+                item = self._lines.get(paid['name'])
+                if item is None:
+                    continue
+                quantity = min(paid['quantity'], item['quantity'])
+                item['quantity'] -= quantity
+                self.total_paise -= quantity * item['price_paise']
+                if item['quantity'] > 0:
+                    deltas.append(self._record('update', dict(item)))
+                    continue
+                self.items.remove(item)
+                del self._lines[paid['name']]
+                deltas.append(self._record('remove', dict(item)))
+        return deltas
+
+    def snapshot(self):
+        """Return the full cart and its total with the sequence number they reflect."""
+        with self._lock:
+            return {
+                'seq': self.seq,
+                'products': [dict(item) for item in self.items],
+                'total_paise': self.total_paise,
+            }
+
+    def deltas_since(self, seq):
+        """Return the deltas after seq, or None when they are no longer in the log."""
+        with self._lock:
+            if seq == self.seq:
+                return []
+            if seq > self.seq:
+                # The client saw a cart this process never produced, e.g. before a restart
+                return None
+            if not self._log or self._log[0]['seq'] > seq + 1:
+                return None
+            return [delta for delta in self._log if delta['seq'] > seq]
+
+    def _record(self, op, item):
+        self.seq += 1
+        delta = {'seq': self.seq, 'op': op, 'item': item, 'total_paise': self.total_paise}
+        self._log.append(delta)
+        return delta
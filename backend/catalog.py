@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_PRICE = 10  # Price used for labels missing from products.json
+
+
+class CatalogEntry:
+    __slots__ = ('category', 'label', 'price', 'price_paise')
+
+    def __init__(self, category, label, price):
+        """One product as seen by the model; category doubles as its cart slot."""
+        self.category = category
+        self.label = label
+        self.price = price
+        self.price_paise = int(round(float(price) * 100))
+
+
+class CatalogIndex:
+    def __init__(self, labels, products):
+        """Immutable category-indexed view of labels.txt joined with products.json."""
+        self.labels = list(labels)
+        self.label_array = np.array(self.labels, dtype=object)
+        self.entries = []
+        for category, label in enumerate(self.labels):
+            details = products.get(label)
+            if details is None or 'price' not in details:
+                print(f"No price for {label} in products file, using {DEFAULT_PRICE}")
+                price = DEFAULT_PRICE
+            else:
+                price = details['price']
+            self.entries.append(CatalogEntry(category, label, price))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def load_labels(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def load_products(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class Catalog:
+    def __init__(self, labels_path, products_path, poll_interval=1.0):
+        """Hold the current CatalogIndex and rebuild it when either source file changes.
+
+        Readers take `catalog.index` once and use that snapshot; reloads swap
+        the reference, so a reader never sees a half-built index.
+        """
+        self.labels_path = labels_path
+        self.products_path = products_path
+        self.poll_interval = poll_interval
+        self._stamp = self._file_stamp()
+        self.index = self._build()
+
+    def _file_stamp(self):
+        stamp = []
+        for path in (self.labels_path, self.products_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _build(self):
+        try:
+            labels = load_labels(self.labels_path)
+        except Exception as e:
+            print(f"Error loading labels: {e}")
+            labels = []
+        try:
+            products = load_products(self.products_path)
+        except Exception as e:
+            print(f"Error loading products: {e}")
+            products = {}
+        try:
+            index = CatalogIndex(labels, products)
+        except Exception as e:
+            # e.g. a price that is not a number; still serve the labels at the default price
+            print(f"Error in products file, using default prices: {e}")
+            index = CatalogIndex(labels, {})
+        print(f"Loaded {len(labels)} labels from {self.labels_path}")
+        return index
+
+    def reload_if_changed(self):
+        """Rebuild the index if labels or products changed on disk; return True on reload."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            labels = load_labels(self.labels_path)
+            products = load_products(self.products_path)
+            index = CatalogIndex(labels, products)
+        except Exception as e:
+            # A partial write or bad data; keep serving the previous index until the next change
+            print(f"Error reloading catalog, keeping previous version: {e}")
+            return False
+        self.index = index
+        print(f"Reloaded catalog with {len(labels)} products")
+        return True
+
+    def start_watching(self):
+        """Poll the source files in a daemon thread and reload on change."""
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                self.reload_if_changed()
+
+        threading.Thread(target=watch, daemon=True).start()
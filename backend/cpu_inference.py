@@ -0,0 +1,334 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+
+import numpy as np
+
+from detections import scaled_transform
+from frame_sources import NUM_OUTPUTS, FrameSource
+from metrics import REGISTRY, hot_log
+
+BATCH_SECONDS = REGISTRY.histogram('checkout_inference_batch_seconds', 'Time to run one batch through the CPU detector')
+LATENCY_SECONDS = REGISTRY.histogram(
+    'checkout_inference_latency_seconds', 'Time from submitting a frame for CPU inference to getting its outputs'
+)
+BATCH_FRAMES = REGISTRY.histogram(
+    'checkout_inference_batch_frames', 'Frames per CPU inference batch', buckets=(1, 2, 4, 8, 16, 32)
+)
+INFERENCE_ERRORS = REGISTRY.counter('checkout_inference_errors_total', 'CPU inference batches that failed')
+
+
+class CpuDetector:
+    def __init__(self, model, runtime='auto', output_format='ssd', input_size=None,
+                 score_threshold=0.05, nms_threshold=0.45, threads=None):
+        """Run a detection model on the CPU and return outputs in the IMX500 layout.
+
+        runtime is 'onnxruntime' (ONNX models), 'opencv' (anything cv2.dnn
+        reads) or 'auto', which prefers ONNX Runtime for .onnx files when it
+        is installed. output_format 'ssd' expects post-processed boxes,
+        classes, scores and count tensors like the IMX500 SSD models, or the
+        single (1, 1, N, 7) DetectionOutput tensor of OpenCV SSD nets; 'yolo'
+        expects a raw (batch, 4 + classes, anchors) tensor and runs NMS here.
+        input_size overrides the model's (width, height) when it has dynamic
+        axes.
+        """
+        self.model = model
+        self.output_format = output_format
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.runtime = self._pick_runtime(runtime)
+        self.batch_axis_fixed = False
+        self._local = threading.local()  # cv2.dnn nets are not thread-safe; one per worker thread
+        self.session = None
+        self.output_names = None
+        if self.runtime == 'onnxruntime':
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.session = ort.InferenceSession(model, options, providers=['CPUExecutionProvider'])
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            self.output_names = [output.name for output in self.session.get_outputs()]
+            shape = model_input.shape
+            # NHWC models (TF exports) have channels last
+            self.channels_last = shape[-1] == 3
+            height, width = (shape[1], shape[2]) if self.channels_last else (shape[2], shape[3])
+            self.batch_axis_fixed = shape[0] == 1
+            self.input_size = input_size or (
+                (width, height) if isinstance(width, int) and isinstance(height, int) else (320, 320)
+            )
+        else:
+            self.channels_last = False
+            self.input_size = input_size or (320, 320)
+            self.output_names = self._net().getUnconnectedOutLayersNames()
+
+    def _pick_runtime(self, runtime):
+        if runtime != 'auto':
+            return runtime
+        if self.model.endswith('.onnx'):
+            try:
+                import onnxruntime  # noqa: F401
+
+                return 'onnxruntime'
+            except ImportError:
+                pass
+        return 'opencv'
+
+    def _net(self):
+        net = getattr(self._local, 'net', None)
+        if net is None:
+            import cv2
+
+            net = self._local.net = cv2.dnn.readNet(self.model)
+        return net
+
+    def preprocess(self, frames):
+        """Stack RGBX camera frames into one float32 input batch at the model's size."""
+        import cv2
+
+        images = [cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB) for frame in frames]
+        blob = cv2.dnn.blobFromImages(images, 1.0 / 255, self.input_size, swapRB=False)
+        return blob.transpose(0, 2, 3, 1) if self.channels_last else blob
+
+    def run(self, blob):
+        if self.session is not None:
+            return self.session.run(self.output_names, {self.input_name: blob})
+        net = self._net()
+        net.setInput(blob)
+        return net.forward(self.output_names)
+
+    def infer(self, frames):
+        """Return one IMX500-style [boxes, classes, scores, count] list per frame."""
+        if self.batch_axis_fixed and len(frames) > 1:
+            # A model exported with batch 1 runs frame by frame
+            return [outputs for frame in frames for outputs in self._infer([frame])]
+        return self._infer(frames)
+
+    def _infer(self, frames):
+        raw = self.run(self.preprocess(frames))
+        if self.output_format == 'yolo':
+            return self._decode_yolo(raw[0])
+        return self._decode_ssd(raw, len(frames))
+
+    def _decode_ssd(self, raw, count):
+        """Split post-processed SSD outputs per frame, matching tensors by name where possible."""
+        if len(raw) == 1 and raw[0].shape[-1] == 7:
+            return self._decode_detection_output(raw[0], count)
+        named = dict(zip(self.output_names, raw))
+        by_role = {}
+        for role in ('box', 'class', 'score', 'num'):
+            matches = [value for name, value in named.items() if role in name.lower()]
+            if len(matches) == 1:
+                by_role[role] = matches[0]
+        if len(by_role) < 4:
+            # IMX500 and TF object detection exports order them boxes, classes, scores, count
+            by_role = dict(zip(('box', 'class', 'score', 'num'), raw))
+        boxes = np.asarray(by_role['box'], dtype=np.float32).reshape(count, -1, 4)
+        classes = np.asarray(by_role['class'], dtype=np.float32).reshape(count, -1)
+        scores = np.asarray(by_role['score'], dtype=np.float32).reshape(count, -1)
+        found = np.asarray(by_role['num']).reshape(count, -1)[:, 0]
+        return [
+            [boxes[i:i + 1], classes[i:i + 1], scores[i:i + 1], found[i:i + 1, None]]
+            for i in range(count)
+        ]
+
+    def _decode_detection_output(self, raw, count):
+        """Split OpenCV DetectionOutput rows of (image, class, score, x0, y0, x1, y1) per frame."""
+        rows = np.asarray(raw, dtype=np.float32).reshape(-1, 7)
+        results = []
+        for image in range(count):
+            mine = rows[rows[:, 0] == image][:NUM_OUTPUTS]
+            boxes = np.zeros((NUM_OUTPUTS, 4), dtype=np.float32)
+            classes = np.zeros(NUM_OUTPUTS, dtype=np.float32)
+            scores = np.zeros(NUM_OUTPUTS, dtype=np.float32)
+            boxes[:len(mine)] = mine[:, [4, 3, 6, 5]]
+            classes[:len(mine)] = mine[:, 1]
+            scores[:len(mine)] = mine[:, 2]
+            results.append([boxes[None], classes[None], scores[None], np.array([[len(mine)]])])
+        return results
+
+    def _decode_yolo(self, raw):
+        """Decode (batch, 4 + classes, anchors) YOLO outputs with per-class NMS."""
+        import cv2
+
+        raw = np.asarray(raw, dtype=np.float32)
+        if raw.shape[1] > raw.shape[2]:
+            raw = raw.transpose(0, 2, 1)
+        width, height = self.input_size
+        results = []
+        for prediction in raw.transpose(0, 2, 1):
+            class_scores = prediction[:, 4:]
+            classes = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(classes)), classes]
+            keep = scores >= self.score_threshold
+            cx, cy, w, h = prediction[keep, :4].T
+            xywh = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+            chosen = cv2.dnn.NMSBoxesBatched(
+                xywh.tolist(), scores[keep].tolist(), classes[keep].tolist(),
+                self.score_threshold, self.nms_threshold
+            )
+            chosen = np.asarray(chosen, dtype=np.int64).reshape(-1)[:NUM_OUTPUTS]
+            boxes = np.zeros((NUM_OUTPUTS, 4), dtype=np.float32)
+            out_classes = np.zeros(NUM_OUTPUTS, dtype=np.float32)
+            out_scores = np.zeros(NUM_OUTPUTS, dtype=np.float32)
+            if len(chosen):
+                x0, y0, w, h = xywh[chosen].T
+                boxes[:len(chosen)] = np.stack([y0 / height, x0 / width, (y0 + h) / height, (x0 + w) / width], axis=1)
+                out_classes[:len(chosen)] = classes[keep][chosen]
+                out_scores[:len(chosen)] = scores[keep][chosen]
+            results.append([boxes[None], out_classes[None], out_scores[None], np.array([[len(chosen)]])])
+        return results
+
+
+class InferenceEngine:
+    def __init__(self, detector, batch_size=4, max_delay=0.005, workers=None):
+        """Batch frames from any number of sources and run them on a thread pool.
+
+        submit() returns a Future for one frame's outputs. A batching thread
+        takes whatever frames are waiting, up to batch_size, waiting at most
+        max_delay after the first for more to arrive, and hands the batch to
+        one of workers threads; the runtimes release the GIL, so batches run
+        in parallel with each other and with the rest of the pipeline.
+        """
+        self.detector = detector
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self._queue = Queue()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='inference')
+        # At most one batch waiting per worker, so frames queue here where they can still join a batch
+        self._slots = threading.Semaphore(self.workers)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish the batches already taken, then stop the batching thread and workers."""
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown()
+
+    def submit(self, frame):
+        future = Future()
+        self._queue.put((frame, future, time.perf_counter()))
+        return future
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._executor.submit(self._infer, batch)
+
+    def _infer(self, batch):
+        try:
+            start = time.perf_counter()
+            try:
+                outputs = self.detector.infer([frame for frame, _, _ in batch])
+            except Exception as e:
+                INFERENCE_ERRORS.inc()
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            done = time.perf_counter()
+            BATCH_SECONDS.observe(done - start)
+            BATCH_FRAMES.observe(len(batch))
+            for (_, future, submitted), result in zip(batch, outputs):
+                LATENCY_SECONDS.observe(done - submitted)
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+class InferenceSource(FrameSource):
+    def __init__(self, source, engine, depth=4, gate=None):
+        """Wrap a frame source whose detections come from a CPU InferenceEngine.
+
+        Each frame is submitted as it is captured and delivered to the
+        callback, in order, once its outputs are ready, so up to depth frames
+        per source are in inference at once and can share a batch. The
+        source's requests must stay valid after its own callback returns,
+        which holds for every source except Picamera2.
+        gate, usually Lane.frame_moving, is asked about each frame first;
+        frames it rejects skip inference and reach the callback marked static.
+        """
+        self.source = source
+        self.engine = engine
+        self.depth = depth
+        self.gate = gate
+        self._pending = Queue(maxsize=depth)
+        self._thread = None
+
+    def start(self, callback):
+        self._thread = threading.Thread(target=self._deliver, args=(callback,), daemon=True)
+        self._thread.start()
+        self.source.start(self._submit)
+
+    def stop(self):
+        self.source.stop()
+
+    def _submit(self, request):
+        # Static frames keep their place in the queue but never reach the engine
+        request.moving = self.gate is None or self.gate(request)
+        future = self.engine.submit(request.frame) if request.moving else None
+        # Blocks the source while depth frames are in flight, pacing it to inference
+        self._pending.put((request, future))
+
+    def _deliver(self, callback):
+        while True:
+            request, future = self._pending.get()
+            if future is None:
+                callback(request)
+                continue
+            try:
+                request.outputs = future.result()
+            except Exception as e:
+                hot_log.log('inference_error', f"Error running CPU inference: {e}")
+                request.outputs = None
+            callback(request)
+
+    def get_outputs(self, request, metadata):
+        return request.outputs
+
+    def box_transform(self, metadata):
+        return scaled_transform()
+
+    def capture_frame(self, request):
+        return self.source.capture_frame(request)
+
+    def capture_lores(self, request):
+        return self.source.capture_lores(request)
+
+    def capture_frame_into(self, request, out):
+        self.source.capture_frame_into(request, out)
+
+    def capture_lores_into(self, request, out):
+        return self.source.capture_lores_into(request, out)
+
+    def motion_sample(self, request):
+        return self.source.motion_sample(request)
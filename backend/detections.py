@@ -0,0 +1,110 @@
+import numpy as np
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+# Normalised (y0, x0, y1, x1) box used to measure the inference-to-frame mapping
+_PROBE_BOX = (0.1, 0.1, 0.9, 0.9)
+
+
+class BoxMapper:
+    def __init__(self, imx500, picam2):
+        """Map normalised inference boxes to frame pixels for a whole batch at once.
+
+        IMX500.convert_inference_coords is affine for a given ScalerCrop, so it is
+        called once per crop on a probe box and the resulting scale/offset is
+        reused for every detection until the crop changes.
+        """
+        self.imx500 = imx500
+        self.picam2 = picam2
+        self._cache = {}
+
+    def transform(self, metadata):
+        """Return (ax, bx, ay, by) such that x_px = ax * x + bx and y_px = ay * y + by."""
+        key = tuple(metadata.get('ScalerCrop', ()))
+        transform = self._cache.get(key)
+        if transform is None:
+            transform = self._probe(metadata)
+            self._cache[key] = transform
+        return transform
+
+    def _probe(self, metadata):
+        y0, x0, y1, x1 = _PROBE_BOX
+        try:
+            px, py, pw, ph = self.imx500.convert_inference_coords(_PROBE_BOX, metadata, self.picam2)
+            ax = pw / (x1 - x0)
+            ay = ph / (y1 - y0)
+            return (ax, px - ax * x0, ay, py - ay * y0)
+        except Exception as e:
+            print(f"Error converting coordinates: {e}")
+            return scaled_transform()
+
+
+def scaled_transform():
+    """Fallback mapping that treats inference coordinates as normalised [0, 1]."""
+    return (float(FRAME_WIDTH), 0.0, float(FRAME_HEIGHT), 0.0)
+
+
+class DetectionBatch:
+    """Struct-of-arrays view of one frame's detections.
+
+    boxes is an (N, 4) int32 array of (x, y, w, h) in frame pixels, categories
+    and scores are length-N arrays and labels holds the matching label strings.
+    """
+
+    __slots__ = ('boxes', 'categories', 'scores', 'labels')
+
+    def __init__(self, boxes, categories, scores, labels):
+        self.boxes = boxes
+        self.categories = categories
+        self.scores = scores
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty((0, 4), dtype=np.int32),
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=object),
+        )
+
+    @classmethod
+    def from_outputs(cls, boxes, scores, classes, threshold, transform, label_array):
+        """Build a batch from raw IMX500 output tensors.
+
+        boxes holds normalised (y0, x0, y1, x1) rows; transform comes from
+        BoxMapper.transform and label_array is an object array of label names.
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        categories = np.asarray(classes).astype(np.int32)
+        keep = (scores >= threshold) & (categories >= 0) & (categories < len(label_array))
+        if not keep.any():
+            return cls.empty()
+
+        raw = np.asarray(boxes, dtype=np.float32)[keep]
+        ax, bx, ay, by = transform
+        pixels = np.empty((len(raw), 4), dtype=np.float32)
+        pixels[:, 0] = raw[:, 1] * ax + bx
+        pixels[:, 1] = raw[:, 0] * ay + by
+        pixels[:, 2] = (raw[:, 3] - raw[:, 1]) * ax
+        pixels[:, 3] = (raw[:, 2] - raw[:, 0]) * ay
+        return cls.from_pixels(pixels, categories[keep], scores[keep], label_array)
+
+    @classmethod
+    def from_pixels(cls, boxes, categories, scores, label_array):
+        """Build a batch from (x, y, w, h) pixel boxes, clamping them to the frame."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        categories = np.asarray(categories, dtype=np.int32).reshape(-1)
+        clamped = np.empty(boxes.shape, dtype=np.int32)
+        clamped[:, 0::2] = np.clip(boxes[:, 0::2], 0, FRAME_WIDTH)
+        clamped[:, 1::2] = np.clip(boxes[:, 1::2], 0, FRAME_HEIGHT)
+        return cls(
+            clamped,
+            categories,
+            np.asarray(scores, dtype=np.float32).reshape(-1),
+            label_array[categories],
+        )
@@ -0,0 +1,181 @@
+import multiprocessing
+import threading
+import time
+from queue import Empty
+
+from frame_hub import TIER_NAMES, TIERS, Channel, encode_channels
+from frame_ring import FrameRing
+from metrics import REGISTRY
+
+JOB_SECONDS = REGISTRY.histogram(
+    'checkout_encode_job_seconds', 'Time from handing a frame to an encode worker to getting its JPEGs back'
+)
+WORKER_ERRORS = REGISTRY.counter('checkout_encode_worker_errors_total', 'Frames an encode worker failed on')
+WORKER_RESTARTS = REGISTRY.counter('checkout_encode_worker_restarts_total', 'Encode workers replaced after dying')
+
+LIVENESS_INTERVAL = 1.0  # Seconds between checks that every worker is still alive
+
+
+def worker_main(ring_name, slots, overlay_streams, jobs, results):
+    """Encode frames from ring slots until a None job arrives.
+
+    Each job is (job_id, slot, has_lores, channel keys, detections, labels),
+    where labels is None unless the label list changed since this worker's
+    last job. The overlay is drawn by this process's own OverlayRenderer,
+    rebuilt when new labels arrive, so usually only the slot index and
+    detections cross the pipe on the way in.
+    """
+    from overlay import OverlayRenderer
+
+    ring = FrameRing(slots, ring_name, create=False)
+    channels = {}
+    renderer = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, slot, has_lores, keys, detections, labels = job
+        if labels is not None:
+            renderer = OverlayRenderer(labels)
+            channels.clear()
+        active = []
+        for key in keys:
+            channel = channels.get(key)
+            if channel is None:
+                stream, tier = key
+                render = renderer.draw if stream in overlay_streams else None
+                channel = channels[key] = Channel(stream, TIERS[TIER_NAMES[tier]], render)
+            active.append(channel)
+        try:
+            encoded = encode_channels(
+                active, ring.frame(slot), detections, ring.lores(slot) if has_lores else None
+            )
+            results.put((job_id, [((c.stream, c.tier.name), jpeg) for c, jpeg in encoded]))
+        except Exception as e:
+            results.put((job_id, e))
+    ring.close()
+
+
+class Worker:
+    __slots__ = ('process', 'jobs', 'labels', 'in_flight')
+
+    def __init__(self, process, jobs):
+        """One encode process with its own job queue and the jobs it has not answered yet."""
+        self.process = process
+        self.jobs = jobs
+        self.labels = None  # Label list last sent to this worker
+        self.in_flight = set()
+
+
+class EncodePool:
+    def __init__(self, ring, workers, labels, overlay_streams=('overlay',)):
+        """Render and JPEG-encode FrameRing frames in worker processes.
+
+        Workers attach to the ring's shared memory and get only slot indices
+        and detections; the compressed JPEG bytes are all that come back.
+        Up to two frames per worker are in flight, so encoding runs on as
+        many cores as there are workers. labels() returns the current label
+        list for the overlay; a new list object is sent to each worker once,
+        with its next job. A worker that dies has its frames returned empty
+        and is replaced, so the hub never waits on it.
+        """
+        self.ring = ring
+        self.workers = workers
+        self.labels = labels
+        self.overlay_streams = tuple(overlay_streams)
+        self.context = multiprocessing.get_context('spawn')
+        self.results = self.context.Queue()
+        self._slots = threading.Semaphore(workers * 2)
+        self._lock = threading.Lock()
+        self._pending = {}  # job id -> (submitted at, active channels by key, done callback, Worker)
+        self._next_id = 0
+        self._workers = []
+        self._collector = None
+
+    def _spawn(self):
+        jobs = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main,
+            args=(self.ring.name, self.ring.slots, self.overlay_streams, jobs, self.results),
+            daemon=True
+        )
+        process.start()
+        return Worker(process, jobs)
+
+    def start(self):
+        self._workers = [self._spawn() for _ in range(self.workers)]
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def stop(self):
+        for worker in self._workers:
+            worker.jobs.put(None)
+        for worker in self._workers:
+            worker.process.join(5)
+
+    def submit(self, active, frame, detections, lores, done):
+        """Queue a ring frame for encoding; done(encoded) gets (channel, jpeg) pairs for active."""
+        # A dead worker never hands its slots back; check for one rather than wait forever
+        while not self._slots.acquire(timeout=LIVENESS_INTERVAL):
+            self._replace_dead_workers()
+        labels = self.labels()
+        with self._lock:
+            self._next_id += 1
+            job_id = self._next_id
+            worker = min(self._workers, key=lambda w: len(w.in_flight))
+            worker.in_flight.add(job_id)
+            self._pending[job_id] = (time.perf_counter(), {(c.stream, c.tier.name): c for c in active}, done, worker)
+            update = None
+            if labels is not worker.labels:
+                worker.labels = labels
+                update = list(labels)
+        worker.jobs.put((
+            job_id, self.ring.slot_of(frame), lores is not None,
+            [(c.stream, c.tier.name) for c in active], detections, update
+        ))
+
+    def _replace_dead_workers(self):
+        """Fail the frames of workers that died, hand back their slots and start replacements."""
+        failed = []
+        with self._lock:
+            for index, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+                print(f"Encode worker {worker.process.pid} exited with {worker.process.exitcode}, restarting it")
+                WORKER_RESTARTS.inc()
+                for job_id in worker.in_flight:
+                    failed.append(self._pending.pop(job_id)[2])
+                self._workers[index] = self._spawn()
+        for done in failed:
+            self._slots.release()
+            try:
+                done([])
+            except Exception as e:
+                print(f"Error publishing encoded frame: {e}")
+
+    def _collect(self):
+        while True:
+            try:
+                job_id, result = self.results.get(timeout=LIVENESS_INTERVAL)
+            except Empty:
+                self._replace_dead_workers()
+                continue
+            with self._lock:
+                pending = self._pending.pop(job_id, None)
+                if pending is not None:
+                    pending[3].in_flight.discard(job_id)
+            if pending is None:
+                continue  # Already failed when its worker was found dead
+            submitted, channels, done, _ = pending
+            self._slots.release()
+            JOB_SECONDS.observe(time.perf_counter() - submitted)
+            if isinstance(result, Exception):
+                WORKER_ERRORS.inc()
+                print(f"Error encoding frame in worker: {result}")
+                encoded = []
+            else:
+                encoded = [(channels[key], jpeg) for key, jpeg in result]
+            try:
+                done(encoded)
+            except Exception as e:
+                print(f"Error publishing encoded frame: {e}")
@@ -0,0 +1,327 @@
+"""Always-on flight recorder of detections and cart events, for looking into disputed charges.
+
+Each lane appends fixed-size binary records to a memory-mapped ring file:
+every published frame with its detections, every frame the tracker
+consumed, detection start/stop and every item added to the cart. Once the
+ring is full the oldest records are overwritten. Frame seqs restart with
+the process, so each open of the ring starts a new run: the header counts
+runs, every record carries its run and a RUN record marks where one
+began. The command line reads a ring back. Examples:
+
+    python flight_recorder.py flight/lane-1.bin --start "2026-10-16 18:02" --end "2026-10-16 18:05"
+    python flight_recorder.py flight/lane-1.bin --start "2026-10-16 18:02" --replay \\
+        --labels assets/labels.txt --products products.json
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b'CKFLIGHT'
+VERSION = 2
+HEADER_SIZE = 64
+
+# Record kinds
+FRAME = 0       # A published frame; category holds how many DETECTION records follow
+DETECTION = 1   # One detection of the preceding FRAME
+TRACKED = 2     # The cart consumer ran the tracker on this frame
+CART_ADD = 3    # track added one of category to the cart; score holds the quantity
+START = 4       # Detection started and the tracker was reset
+STOP = 5        # Detection stopped
+RUN = 6         # The recorder was opened by a new process; frame seqs start again
+
+KIND_NAMES = {FRAME: 'frame', DETECTION: 'detection', TRACKED: 'tracked', CART_ADD: 'cart_add',
+              START: 'start', STOP: 'stop', RUN: 'run'}
+
+RUN_LIMIT = 1 << 16  # Run ids wrap around, as the header and each record hold them in a <u2
+SCORE_SCALE = 10000  # Confidence is stored as an integer in units of 1/10000
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('record_size', '<u4'),
+    ('capacity', '<u8'), ('written', '<u8'), ('created_us', '<i8'), ('run', '<u2'),
+    ('reserved', 'u1', HEADER_SIZE - 42),
+])
+# 32 bytes per record, so a frame with ten detections costs 352 bytes
+RECORD_DTYPE = np.dtype([
+    ('ts_us', '<i8'), ('frame', '<u4'), ('kind', 'u1'), ('reserved', 'u1'),
+    ('category', '<u2'), ('score', '<u2'), ('box', '<u2', (4,)), ('track', '<u4'), ('run', '<u2'),
+])
+
+
+def now_us():
+    return time.time_ns() // 1000
+
+
+class FlightRecorder:
+    def __init__(self, path, capacity=1 << 20):
+        """Append records to the ring file at path, holding the last capacity records.
+
+        An existing ring of the same capacity is continued, so a restart
+        keeps the history; otherwise the file is created afresh. Either way
+        the open starts a new run, recorded in the header and in a RUN
+        record, so frames of different runs never share a key. Writes go
+        straight to the page cache through the mapping and cost a few
+        microseconds per frame; the OS flushes them to disk.
+        """
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        resume = os.path.exists(path) and os.path.getsize(path) == size
+        self._map = np.memmap(path, dtype=np.uint8, mode='r+' if resume else 'w+', shape=(size,))
+        self.header = self._map[:HEADER_SIZE].view(HEADER_DTYPE)
+        self.records = self._map[HEADER_SIZE:].view(RECORD_DTYPE)
+        if not resume or self.header['magic'][0] != MAGIC or self.header['version'][0] != VERSION:
+            self.header['magic'] = MAGIC
+            self.header['version'] = VERSION
+            self.header['record_size'] = RECORD_DTYPE.itemsize
+            self.header['capacity'] = capacity
+            self.header['written'] = 0
+            self.header['created_us'] = now_us()
+            self.header['run'] = 0
+        # Records have room for 16 bits of run; only runs still in the ring need to differ
+        self.run = (int(self.header['run'][0]) + 1) % RUN_LIMIT
+        self.header['run'] = self.run
+        self._written = int(self.header['written'][0])
+        self.record_event(RUN)
+
+    def _append(self, batch):
+        """Stamp a batch of records with the time and write it at the head of the ring."""
+        with self._lock:
+            batch['ts_us'] = now_us()
+            batch['run'] = self.run
+            start = self._written % self.capacity
+            end = start + len(batch)
+            if end <= self.capacity:
+                self.records[start:end] = batch
+            else:
+                self.records[(start + np.arange(len(batch))) % self.capacity] = batch
+            self._written += len(batch)
+            # Readers trust records up to 'written', so it moves only after they are in place
+            self.header['written'] = self._written
+
+    def record_frame(self, frame, detections):
+        """Record a published frame's DetectionBatch as one FRAME record plus one per detection."""
+        count = min(len(detections), 0xFFFF)
+        batch = np.zeros(count + 1, dtype=RECORD_DTYPE)
+        batch['frame'] = frame
+        batch['kind'][0] = FRAME
+        batch['category'][0] = count
+        if count:
+            batch['kind'][1:] = DETECTION
+            batch['category'][1:] = detections.categories[:count]
+            batch['score'][1:] = np.clip(detections.scores[:count] * SCORE_SCALE, 0, SCORE_SCALE)
+            batch['box'][1:] = np.clip(detections.boxes[:count], 0, 0xFFFF)
+        self._append(batch)
+
+    def record_event(self, kind, frame=0, category=0, track=0, quantity=0):
+        batch = np.zeros(1, dtype=RECORD_DTYPE)
+        batch['frame'] = frame
+        batch['kind'] = kind
+        batch['category'] = category
+        batch['score'] = quantity
+        batch['track'] = track
+        self._append(batch)
+
+    def record_tracked(self, frame):
+        self.record_event(TRACKED, frame)
+
+    def record_cart_add(self, frame, track, category, quantity=1):
+        self.record_event(CART_ADD, frame, category, track, quantity)
+
+    def close(self):
+        self._map.flush()
+
+
+class FlightLog:
+    def __init__(self, path):
+        """Read-only view of a FlightRecorder ring, which may still be written to."""
+        self.path = path
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        header = raw[:HEADER_SIZE].view(HEADER_DTYPE)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} flight recorder file")
+        self.capacity = int(header['capacity'])
+        self.created_us = int(header['created_us'])
+        self.run = int(header['run'])
+        self._header = raw[:HEADER_SIZE].view(HEADER_DTYPE)
+        self._records = raw[HEADER_SIZE:].view(RECORD_DTYPE)
+
+    def records(self):
+        """Every record still in the ring, oldest first, as a copied structured array."""
+        written = int(self._header['written'][0])
+        if written <= self.capacity:
+            return np.array(self._records[:written])
+        start = written % self.capacity
+        # The writer may overwrite the oldest records while they are copied; drop a margin of them
+        ordered = np.concatenate([self._records[start:], self._records[:start]])
+        return ordered[64:]
+
+    def between(self, start_us=None, end_us=None):
+        """Records with start_us <= ts_us < end_us, oldest first."""
+        records = self.records()
+        ts = records['ts_us']
+        lo = 0 if start_us is None else np.searchsorted(ts, start_us, 'left')
+        hi = len(records) if end_us is None else np.searchsorted(ts, end_us, 'left')
+        return records[lo:hi]
+
+
+def frame_detections(records):
+    """Map each FRAME's (run, seq) to its (boxes, categories, scores) from the DETECTION records after it."""
+    frames = {}
+    starts = np.flatnonzero(records['kind'] == FRAME)
+    for index in starts:
+        count = int(records['category'][index])
+        detections = records[index + 1:index + 1 + count]
+        detections = detections[detections['kind'] == DETECTION]
+        frames[int(records['run'][index]), int(records['frame'][index])] = (
+            detections['box'].astype(np.int32),
+            detections['category'].astype(np.int32),
+            detections['score'].astype(np.float32) / SCORE_SCALE,
+        )
+    return frames
+
+
+def replay(records, catalog, tracker=None, cart=None):
+    """Run recorded frames back through the tracker and cart exactly as the cart consumer saw them.
+
+    Only frames the consumer actually tracked (TRACKED records) are replayed,
+    and START and RUN records reset the tracker. Returns (cart, added) where added
+    lists (ts_us, frame, label) for every item the replay put in the cart.
+    """
+    from cart import Cart
+    from detections import DetectionBatch
+    from tracker import IoUTracker
+
+    tracker = tracker or IoUTracker()
+    cart = cart or Cart()
+    index = catalog.index
+    frames = frame_detections(records)
+    added = []
+    for record in records[np.isin(records['kind'], (TRACKED, START, RUN))]:
+        if record['kind'] != TRACKED:
+            tracker.reset()
+            continue
+        found = frames.get((int(record['run']), int(record['frame'])))
+        if found is None:
+            continue  # The frame was published before the window
+        boxes, categories, scores = found
+        new_tracks = tracker.update(DetectionBatch.from_pixels(boxes, categories, scores, index.label_array))
+        for track in new_tracks:
+            if track.category < len(index):
+                cart.add(index.entries[track.category])
+                added.append((int(record['ts_us']), int(record['frame']), track.label))
+    return cart, added
+
+
+def replay_window(log, start_us, end_us, catalog):
+    """Replay a time window, starting from the last START or RUN before it so the tracker state matches."""
+    records = log.records()
+    lo = np.searchsorted(records['ts_us'], start_us, 'left') if start_us is not None else 0
+    starts = np.flatnonzero(np.isin(records['kind'][:lo], (START, RUN)))
+    if len(starts):
+        lo = int(starts[-1])
+    hi = np.searchsorted(records['ts_us'], end_us, 'left') if end_us is not None else len(records)
+    return replay(records[lo:hi], catalog)
+
+
+def parse_time(value):
+    """Epoch seconds or a local 'YYYY-MM-DD HH:MM[:SS]' time, as epoch microseconds."""
+    if value is None:
+        return None
+    try:
+        return int(float(value) * 1_000_000)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp() * 1_000_000)
+
+
+def format_record(record, labels):
+    when = datetime.fromtimestamp(record['ts_us'] / 1_000_000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    kind = int(record['kind'])
+    category = int(record['category'])
+    label = labels[category] if category < len(labels) else str(category)
+    line = f"{when} run {int(record['run']):>5} frame {int(record['frame']):>8} {KIND_NAMES.get(kind, kind):<9}"
+    if kind == FRAME:
+        return f"{line} {category} detections"
+    if kind == DETECTION:
+        x, y, w, h = (int(v) for v in record['box'])
+        return f"{line} {label} {record['score'] / SCORE_SCALE:.2f} at ({x}, {y}, {w}, {h})"
+    if kind == CART_ADD:
+        return f"{line} {label} x{int(record['score'])} (track {int(record['track'])})"
+    return line
+
+
+def bench(path, detections, frames=20000):
+    """Print the average cost of recording one frame with the given number of detections."""
+    from detections import DetectionBatch
+
+    recorder = FlightRecorder(path, capacity=1 << 16)
+    labels = np.array([f'label{i}' for i in range(max(detections, 1))], dtype=object)
+    batch = DetectionBatch.from_pixels(
+        [[10 * i, 10 * i, 50, 50] for i in range(detections)], list(range(detections)), [0.9] * detections, labels
+    )
+    start = time.perf_counter()
+    for frame in range(frames):
+        recorder.record_frame(frame, batch)
+    elapsed = time.perf_counter() - start
+    print(f"{detections} detections/frame: {elapsed / frames * 1e6:.2f} us per frame")
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Query or replay a lane's detection flight recorder")
+    parser.add_argument("file", type=str, help="Flight recorder ring file, e.g. flight/lane-1.bin")
+    parser.add_argument("--start", type=str, help="Start time: epoch seconds or 'YYYY-MM-DD HH:MM[:SS]'")
+    parser.add_argument("--end", type=str, help="End time, exclusive")
+    parser.add_argument("--kinds", type=str, help="Comma-separated kinds to print (default: all but detection)")
+    parser.add_argument("--replay", action="store_true",
+                        help="Replay the window through the tracker and cart and compare with what was recorded")
+    parser.add_argument("--labels", type=str, default="assets/labels.txt", help="Path to labels file")
+    parser.add_argument("--products", type=str, default="products.json", help="Path to product details JSON")
+    parser.add_argument("--bench", type=int, metavar="DETECTIONS",
+                        help="Measure recording cost per frame into FILE (overwritten) instead")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    if args.bench is not None:
+        bench(args.file, args.bench)
+        raise SystemExit(0)
+
+    from catalog import Catalog
+
+    catalog = Catalog(args.labels, args.products)
+    log = FlightLog(args.file)
+    start_us, end_us = parse_time(args.start), parse_time(args.end)
+    if args.replay:
+        cart, added = replay_window(log, start_us, end_us, catalog)
+        recorded = log.between(start_us, end_us)
+        recorded = recorded[recorded['kind'] == CART_ADD]
+        labels = catalog.index.labels
+        for ts, frame, label in added:
+            if start_us is None or ts >= start_us:
+                print(f"replayed {datetime.fromtimestamp(ts / 1_000_000)} frame {frame}: {label}")
+        replayed = sorted(label for ts, _, label in added if start_us is None or ts >= start_us)
+        logged = sorted(labels[c] if c < len(labels) else str(c) for c in recorded['category'].tolist())
+        print(f"Replay added {len(replayed)} items, recorder logged {len(logged)}: "
+              f"{'match' if replayed == logged else 'MISMATCH'}")
+        for item in cart.snapshot()['products']:
+            print(f"  {item['name']}: {item['quantity']} x {item['price']}")
+    else:
+        if args.kinds:
+            by_name = {name: kind for kind, name in KIND_NAMES.items()}
+            kinds = [by_name[name] for name in args.kinds.split(',')]
+        else:
+            kinds = [kind for kind in KIND_NAMES if kind != DETECTION]
+        records = log.between(start_us, end_us)
+        records = records[np.isin(records['kind'], kinds)]
+        for record in records:
+            print(format_record(record, catalog.index.labels))
+        print(f"{len(records)} records")
@@ -0,0 +1,403 @@
+import threading
+import time
+from contextlib import nullcontext
+from queue import Empty
+
+from metrics import REGISTRY
+
+
+def encode_jpeg(frame, quality=None):
+    """Convert a camera frame to RGB and encode it as JPEG bytes."""
+    import cv2
+
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if quality else []
+    ret, buffer = cv2.imencode('.jpg', rgb_frame, params)
+    if not ret:
+        return None
+    return buffer.tobytes()
+
+
+def resize_frame(frame, size):
+    """Scale a frame to (width, height), returning it unchanged if it already fits."""
+    import cv2
+
+    if (frame.shape[1], frame.shape[0]) == size:
+        return frame
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_channels(active, frame, detections, lores, timers=None):
+    """Render once per stream, then scale and encode for each active tier; return (channel, jpeg) pairs.
+
+    May draw on frame in place, after the clean channels have been encoded from it.
+    timers, an (overlay, encode) pair of histograms, times the two stages.
+    """
+    overlay_seconds, encode_seconds = timers or (None, None)
+    streams = {}
+    for channel in active:
+        streams.setdefault(channel.stream, []).append(channel)
+    # Encode clean streams first so renderers can draw on the shared frame
+    order = sorted(streams.values(), key=lambda channels: channels[0].render is not None)
+    encoded = []
+    for index, channels in enumerate(order):
+        render = channels[0].render
+        try:
+            if render is not None:
+                later = any(c[0].render is not None for c in order[index + 1:])
+                with overlay_seconds.time() if overlay_seconds is not None else nullcontext():
+                    base = render(frame.copy() if later else frame, detections)
+            else:
+                base = frame
+        except Exception as e:
+            print(f"Error rendering frame for {channels[0].stream} stream: {e}")
+            continue
+        scaled = {}
+        if render is None and lores is not None:
+            # The camera's lores stream is already at a tier size: no resize needed
+            scaled[(lores.shape[1], lores.shape[0])] = lores
+        for channel in channels:
+            try:
+                size = channel.tier.size
+                if size not in scaled:
+                    scaled[size] = resize_frame(base, size)
+                with encode_seconds.time() if encode_seconds is not None else nullcontext():
+                    jpeg = encode_jpeg(scaled[size], channel.tier.quality)
+            except Exception as e:
+                print(f"Error encoding frame for {channel.stream}/{channel.tier.name} stream: {e}")
+                continue
+            if jpeg is not None:
+                encoded.append((channel, jpeg))
+    return encoded
+
+
+class Tier:
+    __slots__ = ('name', 'width', 'height', 'quality')
+
+    def __init__(self, name, width, height, quality):
+        """One encode setting shared by every viewer that asks for it."""
+        self.name = name
+        self.width = width
+        self.height = height
+        self.quality = quality
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+
+# Best first; viewers are stepped down this list when they fall behind
+TIERS = (
+    Tier('high', 640, 480, 85),
+    Tier('medium', 480, 360, 70),
+    Tier('low', 320, 240, 55),
+    Tier('minimal', 160, 120, 40),
+)
+TIER_NAMES = {tier.name: index for index, tier in enumerate(TIERS)}
+
+
+def select_tier(name=None, width=None, quality=None):
+    """Return the best tier index within a requested name, maximum width and JPEG quality."""
+    if name is not None:
+        if name not in TIER_NAMES:
+            raise ValueError(f"Unknown stream tier '{name}'")
+        return TIER_NAMES[name]
+    for index, tier in enumerate(TIERS):
+        if (width is None or tier.width <= width) and (quality is None or tier.quality <= quality):
+            return index
+    return len(TIERS) - 1
+
+
+class Channel:
+    __slots__ = ('stream', 'tier', 'render', 'subscribers', 'seq', 'jpeg', 'frame_id')
+
+    def __init__(self, stream, tier, render):
+        """One encoded output of the hub; render(frame, detections) draws on the frame or is None."""
+        self.stream = stream
+        self.tier = tier
+        self.render = render
+        self.subscribers = 0
+        self.seq = 0
+        self.jpeg = None
+        self.frame_id = 0  # Source frame the current jpeg was encoded from
+
+
+class Subscription:
+    # Average time spent writing a frame, as a share of the frame interval, that switches tiers
+    SLOW_WRITE = 0.5
+    FAST_WRITE = 0.1
+    RECOVER_FRAMES = 50  # Consecutive fast writes before stepping back up
+    SMOOTHING = 0.2
+
+    def __init__(self, hub, stream, tier, fps=None, adaptive=False):
+        """Create a latest-frame-wins cursor into one stream of the hub.
+
+        fps caps how often this viewer is sent a frame. With adaptive set, the
+        time the server spends blocked writing each frame to the viewer's
+        socket (a full send buffer) moves it to a lower tier, and it climbs
+        back to the requested tier once writes are quick again.
+        """
+        self.hub = hub
+        self.stream = stream
+        self.requested = tier
+        self.tier = tier
+        self.interval = 1.0 / fps if fps else 0
+        self.adaptive = adaptive
+        self.cursor = 0
+        self.closed = False
+        self._next_due = 0.0
+        self._yielded = None
+        self._write_share = 0.0
+        self._fast_writes = 0
+
+    @property
+    def channel(self):
+        return self.stream, TIERS[self.tier].name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        now = time.perf_counter()
+        if self._yielded is not None and self.adaptive:
+            # The WSGI server resumes the generator only once the previous frame is written
+            self._adapt(now - self._yielded)
+        if self.interval:
+            if now < self._next_due:
+                time.sleep(self._next_due - now)
+            self._next_due = max(now, self._next_due) + self.interval
+        jpeg, self.cursor = self.hub.wait_for_frame(self.channel, self.cursor)
+        if jpeg is None:
+            raise StopIteration
+        self._yielded = time.perf_counter()
+        return jpeg
+
+    def _adapt(self, write_time):
+        budget = self.interval or self.hub.frame_interval
+        if not budget:
+            return
+        share = write_time / budget
+        self._write_share += self.SMOOTHING * (share - self._write_share)
+        if self._write_share > self.SLOW_WRITE and self.tier < len(TIERS) - 1:
+            self._switch(self.tier + 1)
+        elif share < self.FAST_WRITE and self.tier > self.requested:
+            self._fast_writes += 1
+            if self._fast_writes >= self.RECOVER_FRAMES:
+                self._switch(self.tier - 1)
+        else:
+            self._fast_writes = 0
+
+    def _switch(self, tier):
+        # Join the new channel first so the hub never sees its last viewer leave
+        previous = self.channel
+        self.tier = tier
+        self.hub.add_subscriber(self.channel)
+        self.hub.unsubscribe(previous)
+        self.cursor = 0  # Sequence numbers are per channel
+        self._write_share = 0.0
+        self._fast_writes = 0
+        self.hub.tier_changes.inc()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self.channel)
+
+
+class FrameHub:
+    def __init__(self, source_queue, renderers=None, offload=None, pool=None, release=None, lane=None):
+        """Encode each frame from source_queue once per channel and share the bytes with every subscriber.
+
+        source_queue yields (frame, detections, lores) triples, where lores is
+        an optional smaller copy of the frame. renderers maps a stream name to
+        a render(frame, detections) callable, or None for clean frames. Each
+        stream has one channel per tier, and only channels with viewers are
+        rendered and encoded. offload(fn, args), if given, runs the render and
+        encode work elsewhere, e.g. on gevent's native thread pool so it does
+        not stall the event loop. pool, an EncodePool, instead encodes several
+        frames at once in worker processes. release(frame), if given, is
+        called once the hub is done with a frame, e.g. to free its FrameRing slot.
+        lane, if given, labels the hub's metrics.
+        """
+        self.source_queue = source_queue
+        self.offload = offload
+        self.pool = pool
+        self.release = release
+        self._frames = 0  # Frames taken from source_queue; numbers results from the pool
+        self.channels = {
+            (stream, tier.name): Channel(stream, tier, render)
+            for stream, render in (renderers or {'clean': None}).items()
+            for tier in TIERS
+        }
+        self.frame_interval = 0.0  # Smoothed seconds between source frames
+        self._last_frame = None
+        self._stale = False  # Queued frames predate the current viewers and must not be shown
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        labels = {'lane': lane} if lane is not None else {}
+        REGISTRY.gauge('checkout_stream_viewers', 'Connected /video_feed viewers', read=lambda: self.subscribers, **labels)
+        # Encoding in pool workers is timed in their processes, so these only cover in-process encodes
+        self.timers = (
+            REGISTRY.histogram('checkout_stage_seconds', 'Duration of each pipeline stage', stage='overlay_draw', **labels),
+            REGISTRY.histogram('checkout_stage_seconds', 'Duration of each pipeline stage', stage='jpeg_encode', **labels),
+        )
+        self.tier_changes = REGISTRY.counter(
+            'checkout_stream_tier_changes_total', 'Automatic stream tier switches for slow or recovered viewers', **labels
+        )
+
+    def start(self):
+        """Start the encoder thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the encoder thread and release every waiting subscriber."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def subscribers(self):
+        return sum(channel.subscribers for channel in self.channels.values())
+
+    def subscribe(self, stream, tier=0, fps=None, adaptive=False):
+        """Register a viewer on a stream at a tier index and return its frame cursor."""
+        subscription = Subscription(self, stream, tier, fps, adaptive)
+        self.add_subscriber(subscription.channel)
+        return subscription
+
+    def add_subscriber(self, channel):
+        with self._cond:
+            if not self._active_channels():
+                # Anything queued while nobody watched may be hours old; start from a new frame
+                self._stale = True
+            self.channels[channel].subscribers += 1
+            self._cond.notify_all()
+
+    def unsubscribe(self, channel):
+        with self._cond:
+            state = self.channels[channel]
+            state.subscribers -= 1
+            if state.subscribers == 0:
+                state.jpeg = None  # Never repeat a frame encoded before the channel went idle
+            idle = not self._active_channels()
+        if idle:
+            self._drain()
+
+    def wait_for_frame(self, channel, cursor, timeout=None):
+        """Block until channel has a frame newer than cursor; return (jpeg, new_cursor).
+
+        Viewers that fall behind skip straight to the newest frame. A channel
+        that went idle keeps its seq but drops its JPEG, so a viewer joining it
+        waits for the next frame encoded for it rather than seeing no frame.
+        """
+        state = self.channels[channel]
+
+        def ready():
+            return state.seq > cursor and state.jpeg is not None
+
+        with self._cond:
+            ok = self._cond.wait_for(lambda: ready() or not self._running, timeout)
+            if not ok or not ready():
+                return None, cursor
+            return state.jpeg, state.seq
+
+    def needs_frame(self):
+        """True if a watched channel has nothing encoded yet and so cannot be repeated."""
+        with self._cond:
+            return any(c.jpeg is None for c in self._active_channels())
+
+    def repeat(self):
+        """Re-send each watched channel's last JPEG without rendering or encoding anything."""
+        with self._cond:
+            for channel in self._active_channels():
+                if channel.jpeg is not None:
+                    channel.seq += 1
+            self._cond.notify_all()
+
+    def _drain(self):
+        """Drop every queued frame, releasing each one."""
+        while True:
+            try:
+                item = self.source_queue.get_nowait()
+            except Empty:
+                return
+            if self.release is not None:
+                self.release(item[0])
+
+    def _next_frame(self):
+        """Take the newest item from the source queue, discarding any backlog."""
+        try:
+            item = self.source_queue.get(timeout=0.5)
+        except Empty:
+            return None
+        while True:
+            try:
+                newer = self.source_queue.get_nowait()
+            except Empty:
+                return item
+            if self.release is not None:
+                self.release(item[0])
+            item = newer
+
+    def _active_channels(self):
+        return [c for c in self.channels.values() if c.subscribers > 0]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Idle without rendering or encoding anything while nobody is watching
+                self._cond.wait_for(lambda: self._active_channels() or not self._running)
+                if not self._running:
+                    return
+                active = self._active_channels()
+                stale, self._stale = self._stale, False
+            if stale:
+                self._drain()
+            item = self._next_frame()
+            if item is None:
+                continue
+            frame, detections, lores = item
+            now = time.perf_counter()
+            if self._last_frame is not None:
+                elapsed = now - self._last_frame
+                self.frame_interval += 0.1 * (elapsed - self.frame_interval) if self.frame_interval else elapsed
+            self._last_frame = now
+            self._frames += 1
+            frame_id = self._frames
+            if self.pool is not None:
+                # Blocks while every worker is busy; newer frames then replace the backlog
+                self.pool.submit(active, frame, detections, lores,
+                                 lambda encoded, f=frame, i=frame_id: self._finish(i, f, encoded))
+                continue
+            if self.offload is not None:
+                encoded = self.offload(encode_channels, (active, frame, detections, lores, self.timers))
+            else:
+                encoded = encode_channels(active, frame, detections, lores, self.timers)
+            self._finish(frame_id, frame, encoded)
+
+    def _finish(self, frame_id, frame, encoded):
+        """Publish a frame's JPEGs, skipping channels that already show a newer frame."""
+        with self._cond:
+            for channel, jpeg in encoded:
+                if frame_id <= channel.frame_id:
+                    continue
+                channel.frame_id = frame_id
+                channel.jpeg = jpeg
+                channel.seq += 1
+            self._cond.notify_all()
+        if self.release is not None:
+            self.release(frame)
@@ -0,0 +1,72 @@
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detections import FRAME_HEIGHT, FRAME_WIDTH
+from frame_sources import LORES_SIZE
+
+MAIN_SHAPE = (FRAME_HEIGHT, FRAME_WIDTH, 4)
+LORES_SHAPE = (LORES_SIZE[1], LORES_SIZE[0], 4)
+
+
+class FrameRing:
+    def __init__(self, slots, name=None, create=True):
+        """Fixed slots of shared memory, each holding a main frame and its lores copy.
+
+        The creating process hands out slots with acquire() and takes them
+        back with release(); other processes attach by name and only read and
+        write the slots whose index they are given, so frames cross process
+        boundaries without being pickled or copied.
+        """
+        self.slots = slots
+        self.main_bytes = int(np.prod(MAIN_SHAPE))
+        self.slot_bytes = self.main_bytes + int(np.prod(LORES_SHAPE))
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.owner = create
+        self.buffer = np.frombuffer(self.shm.buf, dtype=np.uint8, count=slots * self.slot_bytes)
+        self._base = self.buffer.ctypes.data
+        self._lock = threading.Lock()
+        self._free = list(range(slots))
+
+    def acquire(self):
+        """Take a free slot index, or None if every slot is in use."""
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+    def release_frame(self, frame):
+        """Release the slot a frame view returned by frame() belongs to."""
+        self.release(self.slot_of(frame))
+
+    def free_slots(self):
+        with self._lock:
+            return len(self._free)
+
+    def frame(self, slot):
+        start = slot * self.slot_bytes
+        return self.buffer[start:start + self.main_bytes].reshape(MAIN_SHAPE)
+
+    def lores(self, slot):
+        start = slot * self.slot_bytes + self.main_bytes
+        return self.buffer[start:start + self.slot_bytes - self.main_bytes].reshape(LORES_SHAPE)
+
+    def slot_of(self, frame):
+        return (frame.ctypes.data - self._base) // self.slot_bytes
+
+    def close(self):
+        """Detach from the shared memory, removing it if this process created it."""
+        self.buffer = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A frame view is still alive; the mapping goes with the process
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,296 @@
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+from detections import FRAME_HEIGHT, FRAME_WIDTH, BoxMapper, scaled_transform
+
+NUM_OUTPUTS = 100  # Detections per output tensor, as produced by the IMX500 SSD models
+LORES_SIZE = (320, 240)  # Matches the hub's 'low' stream tier, so those viewers skip the resize
+MOTION_STEP = 8  # Pixel stride of the luma sample taken from the main frame for motion gating
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class SourceFrame:
+    __slots__ = ('frame', 'metadata', 'outputs', 'moving')
+
+    def __init__(self, frame, metadata=None, outputs=None):
+        """Request-like wrapper for frames that do not come from Picamera2."""
+        self.frame = frame
+        self.metadata = metadata or {}
+        self.outputs = outputs
+        self.moving = None  # Motion gate decision, when it was made before the lane callback
+
+    def get_metadata(self):
+        return self.metadata
+
+
+class FrameSource:
+    """Delivers frames to a callback and tells the pipeline how to read them.
+
+    The callback receives a request object; the pipeline then calls
+    get_outputs, box_transform and capture_frame on the source with it.
+    Frames use the Picamera2 main-stream layout (640x480, RGBX byte order).
+    """
+
+    def start(self, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def get_outputs(self, request, metadata):
+        """Raw detector outputs as [boxes, classes, scores, count] batches, or None."""
+        return request.outputs
+
+    def box_transform(self, metadata):
+        return scaled_transform()
+
+    def capture_frame(self, request):
+        """Return an array the pipeline may keep after the callback returns."""
+        return request.frame
+
+    def capture_lores(self, request):
+        """Return a smaller owned copy of the frame in the same layout, or None if there is none."""
+        return None
+
+    def capture_frame_into(self, request, out):
+        """Copy the frame into out, e.g. a FrameRing slot, instead of allocating a new array."""
+        np.copyto(out, request.frame)
+
+    def capture_lores_into(self, request, out):
+        """Write the lores frame into out; return False if there is none."""
+        return False
+
+    def motion_sample(self, request):
+        """Return a small owned 2-D luma-like array for scene-change detection."""
+        # Green carries most of the luma and needs no colour conversion
+        return request.frame[::MOTION_STEP, ::MOTION_STEP, 1].copy()
+
+
+class Picamera2Source(FrameSource):
+    def __init__(self, model, fps, show_preview=True, camera=None):
+        """Picamera2 with on-sensor IMX500 inference; the libraries load on start().
+
+        camera picks the camera number when several are attached; the network
+        is loaded onto that camera's IMX500, so frames and detections come from
+        the same sensor. By default it is the first IMX500 found.
+        """
+        self.model = model
+        self.fps = fps
+        self.show_preview = show_preview
+        self.camera = camera
+        self.imx500 = None
+        self.picam2 = None
+        self.box_mapper = None
+        self._mapped_array = None
+
+    def start(self, callback):
+        from picamera2 import MappedArray, Picamera2
+        from picamera2.devices.imx500 import IMX500
+
+        self._mapped_array = MappedArray
+        # IMX500 matches camera_id against each sensor's device tree path, which is the camera's Id
+        camera_id = '' if self.camera is None else Picamera2.global_camera_info()[self.camera]['Id']
+        self.imx500 = IMX500(self.model, camera_id=camera_id)
+        self.imx500.show_network_fw_progress_bar()
+        self.picam2 = Picamera2(self.imx500.camera_num)
+        config = self.picam2.create_video_configuration(
+            main={"size": (FRAME_WIDTH, FRAME_HEIGHT)},
+            lores={"size": LORES_SIZE},
+            controls={"FrameRate": self.fps}
+        )
+        self.box_mapper = BoxMapper(self.imx500, self.picam2)
+        self.picam2.pre_callback = callback
+        self.picam2.start(config, show_preview=self.show_preview)
+
+    def stop(self):
+        if self.picam2 is not None:
+            self.picam2.stop()
+
+    def get_outputs(self, request, metadata):
+        return self.imx500.get_outputs(metadata, add_batch=True)
+
+    def box_transform(self, metadata):
+        return self.box_mapper.transform(metadata)
+
+    def capture_frame(self, request):
+        with self._mapped_array(request, "main") as m:
+            return m.array.copy()
+
+    def capture_lores(self, request):
+        import cv2
+
+        # lores is YUV420; converting it also makes the owned copy
+        with self._mapped_array(request, "lores") as m:
+            return cv2.cvtColor(m.array, cv2.COLOR_YUV2RGBA_I420)
+
+    def capture_frame_into(self, request, out):
+        with self._mapped_array(request, "main") as m:
+            np.copyto(out, m.array)
+
+    def capture_lores_into(self, request, out):
+        import cv2
+
+        with self._mapped_array(request, "lores") as m:
+            cv2.cvtColor(m.array, cv2.COLOR_YUV2RGBA_I420, dst=out)
+        return True
+
+    def motion_sample(self, request):
+        # The first LORES_SIZE[1] rows of the YUV420 lores buffer are the Y plane
+        step = MOTION_STEP // 2
+        with self._mapped_array(request, "lores") as m:
+            return m.array[:LORES_SIZE[1]:step, :LORES_SIZE[0]:step].copy()
+
+
+class PacedSource(FrameSource):
+    def __init__(self, fps):
+        """Base for sources that produce frames on their own thread at a fixed rate."""
+        self.fps = fps
+        self._running = False
+        self._thread = None
+
+    def start(self, callback):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+    def read(self, index):
+        """Return the next SourceFrame, or None when the source is exhausted."""
+        raise NotImplementedError
+
+    def _run(self, callback):
+        start = time.perf_counter()
+        index = 0
+        while self._running:
+            request = self.read(index)
+            if request is None:
+                break
+            callback(request)
+            index += 1
+            # Read after the first frame: file sources only learn their rate on open
+            interval = 1.0 / self.fps if self.fps else 0
+            if interval:
+                time.sleep(max(0.0, start + index * interval - time.perf_counter()))
+
+
+def to_camera_layout(image):
+    """Convert an OpenCV BGR image to the 640x480 RGBX layout of the Picamera2 main stream."""
+    import cv2
+
+    if image.shape[1] != FRAME_WIDTH or image.shape[0] != FRAME_HEIGHT:
+        image = cv2.resize(image, (FRAME_WIDTH, FRAME_HEIGHT))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+
+
+class VideoFileSource(PacedSource):
+    def __init__(self, path, fps=None, loop=True):
+        """Frames from a video file, paced at fps (default: the file's own rate)."""
+        super().__init__(fps)
+        self.path = path
+        self.loop = loop
+        self._capture = None
+
+    def read(self, index):
+        import cv2
+
+        if self._capture is None:
+            self._capture = cv2.VideoCapture(self.path)
+            if not self.fps:
+                self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 15
+        ok, image = self._capture.read()
+        if not ok and self.loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self._capture.read()
+        if not ok:
+            return None
+        return SourceFrame(to_camera_layout(image))
+
+
+class ImageDirectorySource(PacedSource):
+    def __init__(self, directory, fps=15, loop=True):
+        """Frames from the images in a directory, in file name order."""
+        super().__init__(fps)
+        self.paths = sorted(
+            path for path in glob.glob(os.path.join(directory, '*'))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.loop = loop
+
+    def read(self, index):
+        import cv2
+
+        if not self.paths or (index >= len(self.paths) and not self.loop):
+            return None
+        image = cv2.imread(self.paths[index % len(self.paths)])
+        if image is None:
+            return SourceFrame(np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 4), dtype=np.uint8))
+        return SourceFrame(to_camera_layout(image))
+
+
+class Scene:
+    def __init__(self, count, num_labels, lifetime=45):
+        """Generate IMX500-style output tensors for count objects replaced every lifetime frames.
+
+        Objects sit on a grid and drift slightly each frame, so a tracker keeps
+        their IDs, and each replacement shows up as a new object.
+        """
+        self.count = count
+        self.num_labels = max(num_labels, 1)
+        self.lifetime = lifetime
+        side = max(int(np.ceil(np.sqrt(max(count, 1)))), 1)
+        cells = np.arange(count)
+        self.origin = np.stack([(cells // side) / side, (cells % side) / side], axis=1).astype(np.float32)
+        self.size = 0.6 / side
+        self.scores = np.full(NUM_OUTPUTS, 0.05, dtype=np.float32)
+        self.scores[:count] = 0.9
+
+    def outputs(self, index):
+        boxes = np.zeros((NUM_OUTPUTS, 4), dtype=np.float32)
+        classes = np.zeros(NUM_OUTPUTS, dtype=np.float32)
+        if self.count:
+            generation = index // self.lifetime
+            drift = (index % self.lifetime) * 0.001
+            y0 = self.origin[:, 0] + drift
+            x0 = self.origin[:, 1] + drift + (generation % 2) * 0.02
+            boxes[:self.count] = np.stack([y0, x0, y0 + self.size, x0 + self.size], axis=1)
+            classes[:self.count] = (np.arange(self.count) + generation) % self.num_labels
+        return [boxes[None], classes[None], self.scores[None], np.array([[self.count]])]
+
+
+def synthetic_frames(count, seed=0):
+    """Textured frames in the camera layout, varied enough to exercise JPEG encoding.
+
+    The noise also lands in the green channel that motion_sample reads, so
+    cycling through the frames counts as motion for the MotionGate.
+    """
+    rng = np.random.default_rng(seed)
+    base = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 4), dtype=np.uint8)
+    base[..., 0] = np.linspace(0, 255, FRAME_WIDTH, dtype=np.uint8)[None, :]
+    base[..., 1] = np.linspace(0, 255, FRAME_HEIGHT, dtype=np.uint8)[:, None]
+    frames = []
+    for _ in range(count):
+        frame = base.copy()
+        noise = rng.integers(0, 32, (FRAME_HEIGHT, FRAME_WIDTH), dtype=np.uint8)
+        frame[..., 2] = noise
+        frame[..., 1] ^= noise
+        frames.append(frame)
+    return frames
+
+
+class SyntheticSource(PacedSource):
+    def __init__(self, fps=15, detections=0, num_labels=1, frames=None):
+        """Generated frames with generated detector outputs, for running without hardware."""
+        super().__init__(fps)
+        self.scene = Scene(detections, num_labels)
+        self.frames = frames or synthetic_frames(30)
+
+    def read(self, index):
+        return SourceFrame(self.frames[index % len(self.frames)], outputs=self.scene.outputs(index))
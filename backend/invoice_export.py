@@ -0,0 +1,134 @@
+"""Export invoice history for offline reporting, one row per line item.
+
+Invoices are read with a MongoDB cursor and written in chunks, so memory
+stays at one chunk however long the history is. Parquet and Arrow need
+pyarrow; CSV needs nothing extra. Example:
+
+    python invoice_export.py --format parquet --out invoices.parquet \\
+        --start-date 2026-01-01 --end-date 2026-03-31
+"""
+import argparse
+import csv
+import os
+import time
+
+from invoice_schema import ProductIds, expand, to_paise
+from transactions import build_query
+
+COLUMNS = ('payment_id', 'order_id', 'timestamp', 'date', 'invoice_total_paise',
+           'line', 'product', 'quantity', 'price_paise')
+
+
+def line_rows(invoice):
+    """Yield one row tuple per line item of an invoice in the API shape."""
+    head = (invoice.get('payment_id'), invoice.get('order_id'), invoice.get('timestamp'),
+            invoice.get('date'), to_paise(invoice.get('total_amount', invoice.get('amount', 0))))
+    products = invoice.get('products') or []
+    if not products:
+        yield head + (None, None, None, None)
+    for line, product in enumerate(products):
+        yield head + (line, product.get('name'), int(product.get('quantity', 0)), to_paise(product.get('price', 0)))
+
+
+def chunks(collection, product_ids, query, chunk_size):
+    """Yield lists of up to chunk_size rows, oldest invoice first."""
+    cursor = collection.find(query).sort([('timestamp', 1), ('_id', 1)]).batch_size(chunk_size)
+    rows = []
+    try:
+        for doc in cursor:
+            rows.extend(line_rows(expand(doc, product_ids)))
+            if len(rows) >= chunk_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+    finally:
+        cursor.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    def __init__(self, path, parquet=True):
+        """Write row chunks as record batches to a Parquet file or an Arrow IPC stream."""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise SystemExit("pyarrow is required for parquet and arrow exports; use --format csv otherwise")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('payment_id', pa.string()), ('order_id', pa.string()), ('timestamp', pa.float64()),
+            ('date', pa.string()), ('invoice_total_paise', pa.int64()), ('line', pa.int32()),
+            ('product', pa.string()), ('quantity', pa.int32()), ('price_paise', pa.int64()),
+        ])
+        if parquet:
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self.sink = pa.OSFile(path, 'wb')
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        batch = self.pa.record_batch(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        if hasattr(self, 'sink'):
+            self.sink.close()
+
+
+def export(collection, product_ids, query, writer, chunk_size=5000):
+    """Write every matching invoice through writer; return (invoices, rows) written."""
+    rows_written = 0
+    invoices = 0
+    for rows in chunks(collection, product_ids, query, chunk_size):
+        writer.write(rows)
+        rows_written += len(rows)
+        # Each invoice has exactly one first (or empty) line
+        invoices += sum(1 for row in rows if not row[5])
+    return invoices, rows_written
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Export invoice line items for offline reporting")
+    parser.add_argument("--out", type=str, required=True, help="File to write")
+    parser.add_argument("--format", choices=["parquet", "arrow", "csv"], default="parquet", help="Output format")
+    parser.add_argument("--start-date", type=str, help="First invoice date to include (YYYY-MM-DD)")
+    parser.add_argument("--end-date", type=str, help="Last invoice date to include (YYYY-MM-DD)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per written chunk")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    args = get_args()
+    query, _, _ = build_query({'start_date': args.start_date, 'end_date': args.end_date})
+    db = MongoClient(os.getenv('MONGODB_URI')).smart_checkout
+    writer = CsvWriter(args.out) if args.format == 'csv' else ArrowWriter(args.out, args.format == 'parquet')
+    start = time.time()
+    try:
+        invoices, rows = export(db.invoices, ProductIds(db), query, writer, args.chunk_size)
+    finally:
+        writer.close()
+    print(f"Exported {rows} line items from {invoices} invoices to {args.out} in {time.time() - start:.2f}s")
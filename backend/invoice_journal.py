@@ -0,0 +1,245 @@
+import json
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+
+DUPLICATE_KEY = 11000
+ORDER_RETENTION = 7 * 24 * 3600  # Seconds a priced order is kept for its payment to arrive or be retried
+
+INSERT_SECONDS = REGISTRY.histogram('checkout_mongodb_insert_seconds', 'Duration of invoice insert_many batches')
+INSERT_ERRORS = REGISTRY.counter('checkout_mongodb_insert_errors_total', 'Invoice batches that failed to insert')
+FLUSHED_INVOICES = REGISTRY.counter('checkout_invoices_flushed_total', 'Invoices moved from the journal to MongoDB')
+FAILED_INVOICES = REGISTRY.counter(
+    'checkout_invoices_failed_total', 'Invoices set aside in the journal because MongoDB or the transform rejected them'
+)
+
+
+class InvoiceJournal:
+    def __init__(self, path, collection=None, batch_size=100, retry_interval=5.0):
+        """Durable local queue of invoices waiting to be written to MongoDB.
+
+        append() commits to a SQLite WAL journal and returns right away; a
+        background flusher moves pending invoices to MongoDB with insert_many.
+        Invoices are keyed by payment_id, so repeats are ignored locally and a
+        unique index makes re-sent batches harmless in MongoDB. Anything still
+        pending when the process stops is flushed on the next start.
+
+        The cart snapshots orders were priced from are kept in the same
+        database, so a payment can still be invoiced after a restart, and
+        stay marked with their payment_id so a retried payment is recognised.
+        An invoice that can never be stored is moved to a failed table with
+        its error rather than holding up the ones behind it.
+        """
+        self.path = path
+        self.collection = collection
+        self.transform = None
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._listeners = []
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            'payment_id TEXT PRIMARY KEY, doc TEXT NOT NULL, created REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS orders ('
+            'order_id TEXT PRIMARY KEY, lane TEXT NOT NULL, snapshot TEXT NOT NULL, run TEXT NOT NULL, '
+            'created REAL NOT NULL, payment_id TEXT)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS orders_payment_id ON orders (payment_id)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS failed ('
+            'payment_id TEXT PRIMARY KEY, doc TEXT NOT NULL, error TEXT NOT NULL, failed REAL NOT NULL)'
+        )
+        REGISTRY.gauge('checkout_invoices_pending', 'Invoices journaled but not yet in MongoDB', read=self.pending_count)
+
+    def attach(self, collection, transform=None):
+        """Set the MongoDB collection to flush to and make sure it dedupes on payment_id.
+
+        transform(invoice), if given, converts each journaled invoice to the
+        stored document; flush listeners still get the journaled form.
+        """
+        try:
+            collection.create_index('payment_id', unique=True, name='payment_id_unique')
+        except Exception as e:
+            print(f"Could not create unique payment_id index: {e}")
+        self.transform = transform
+        self.collection = collection
+        self._wake.set()
+
+    def on_flush(self, callback):
+        """Call callback(invoices) with the invoices each flush newly stored in MongoDB."""
+        self._listeners.append(callback)
+
+    def remember_order(self, order_id, lane, snapshot, run):
+        """Keep the lane and cart snapshot an order was priced from until its payment arrives.
+
+        run identifies the process that priced it, since lane carts do not
+        survive a restart. Orders older than ORDER_RETENTION are dropped.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('DELETE FROM orders WHERE created < ?', (now - ORDER_RETENTION,))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO orders (order_id, lane, snapshot, run, created) VALUES (?, ?, ?, ?, ?)',
+                (order_id, lane, json.dumps(snapshot), run, now)
+            )
+
+    def order(self, order_id):
+        """Return (lane, snapshot, run, payment_id) for an order, or None if it is not known."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT lane, snapshot, run, payment_id FROM orders WHERE order_id = ?', (order_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        lane, snapshot, run, payment_id = row
+        return lane, json.loads(snapshot), run, payment_id
+
+    def has_payment(self, payment_id):
+        """Whether an invoice for payment_id was journaled, whether or not it reached MongoDB yet."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM pending WHERE payment_id = ? UNION ALL '
+                'SELECT 1 FROM failed WHERE payment_id = ? UNION ALL '
+                'SELECT 1 FROM orders WHERE payment_id = ? LIMIT 1',
+                (payment_id, payment_id, payment_id)
+            ).fetchone() is not None
+
+    def append(self, invoice):
+        """Record an invoice durably; return False if its payment_id is already pending.
+
+        Its order, if remembered, is marked paid in the same transaction.
+        """
+        doc = json.dumps(invoice, default=str)
+        with self._lock:
+            # The connection autocommits, so both writes are wrapped in an explicit transaction
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO pending (payment_id, doc, created) VALUES (?, ?, ?)',
+                    (invoice['payment_id'], doc, time.time())
+                )
+                self._conn.execute(
+                    'UPDATE orders SET payment_id = ? WHERE order_id = ?',
+                    (invoice['payment_id'], invoice.get('order_id'))
+                )
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        self._wake.set()
+        return cursor.rowcount == 1
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def _pending_batch(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT payment_id, doc FROM pending ORDER BY created LIMIT ?',
+                (self.batch_size,)
+            ).fetchall()
+        return [payment_id for payment_id, _ in rows], [json.loads(doc) for _, doc in rows]
+
+    def _set_aside(self, payment_id, doc, error):
+        """Move an invoice that cannot be stored out of pending, keeping it and its error for a look."""
+        print(f"Invoice {payment_id} set aside, it cannot be stored: {error}")
+        FAILED_INVOICES.inc()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO failed (payment_id, doc, error, failed) VALUES (?, ?, ?, ?)',
+                    (payment_id, json.dumps(doc, default=str), str(error), time.time())
+                )
+                self._conn.execute('DELETE FROM pending WHERE payment_id = ?', (payment_id,))
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _remove(self, payment_ids):
+        with self._lock:
+            placeholders = ','.join('?' * len(payment_ids))
+            self._conn.execute(
+                f'DELETE FROM pending WHERE payment_id IN ({placeholders})', payment_ids
+            )
+
+    def flush(self):
+        """Insert one batch of pending invoices into MongoDB; return how many were flushed."""
+        if self.collection is None:
+            return 0
+        payment_ids, docs = self._pending_batch()
+        if not docs:
+            return 0
+        # Only needed once there is a collection to write to, so a journal without MongoDB needs no pymongo
+        from pymongo.errors import BulkWriteError, PyMongoError
+
+        flushed = len(payment_ids)
+        rows = docs
+        if self.transform is not None:
+            rows, kept = [], []
+            for payment_id, doc in zip(payment_ids, docs):
+                try:
+                    rows.append(self.transform(doc))
+                except PyMongoError:
+                    raise  # The transform's own lookups failed; retry the whole batch later
+                except Exception as e:
+                    self._set_aside(payment_id, doc, e)
+                    continue
+                kept.append((payment_id, doc))
+            payment_ids = [payment_id for payment_id, _ in kept]
+            docs = [doc for _, doc in kept]
+        if not rows:
+            return flushed
+        stored = docs
+        try:
+            with INSERT_SECONDS.time():
+                self.collection.insert_many(rows, ordered=False)
+        except BulkWriteError as e:
+            if e.details.get('writeConcernErrors'):
+                INSERT_ERRORS.inc()
+                raise
+            # Duplicates were stored by an earlier attempt that died before clearing the journal;
+            # any other error is about that one document, so it is set aside and the rest go through
+            skipped = set()
+            for err in e.details.get('writeErrors', []):
+                skipped.add(err['index'])
+                if err.get('code') != DUPLICATE_KEY:
+                    INSERT_ERRORS.inc()
+                    self._set_aside(payment_ids[err['index']], docs[err['index']], err.get('errmsg', err))
+            stored = [doc for i, doc in enumerate(docs) if i not in skipped]
+        except Exception:
+            INSERT_ERRORS.inc()
+            raise
+        self._remove(payment_ids)
+        FLUSHED_INVOICES.inc(len(stored))
+        for callback in self._listeners:
+            try:
+                callback(stored)
+            except Exception as e:
+                print(f"Error in invoice flush listener: {e}")
+        return flushed
+
+    def start(self):
+        """Start the background flusher, replaying anything left from a previous run."""
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.retry_interval)
+            self._wake.clear()
+            try:
+                while self.flush() == self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Error flushing invoices to MongoDB, will retry: {e}")
+                time.sleep(self.retry_interval)
@@ -0,0 +1,199 @@
+import argparse
+import os
+import threading
+import time
+
+SCHEMA_VERSION = 2
+
+# Values every invoice used to store verbatim; v2 documents omit them
+CONSTANT_FIELDS = {
+    'status': 'paid',
+    'payment_method': 'razorpay',
+    'currency': 'INR',
+    'payment_status': 'success',
+}
+
+# API field -> stored fields it is built from, covering both v1 and v2 documents
+STORED_FIELDS = {
+    'order_id': ('order_id',),
+    'payment_id': ('payment_id',),
+    'transaction_id': ('payment_id', 'transaction_id'),
+    'timestamp': ('timestamp',),
+    'date': ('date',),
+    'time': ('timestamp', 'time'),
+    'amount': ('total', 'amount'),
+    'total_amount': ('total', 'total_amount'),
+    'products': ('items', 'products'),
+    'total_items': ('items', 'total_items'),
+}
+
+
+def to_paise(rupees):
+    return int(round(float(rupees) * 100))
+
+
+class ProductIds:
+    def __init__(self, db):
+        """Small integer IDs for product names, stored in db.product_ids.
+
+        v2 invoices hold these IDs instead of repeating each product's name.
+        IDs come from a counter in db.counters and are never reused; names
+        are cached after the first lookup either way.
+        """
+        self.collection = db.product_ids
+        self.counters = db.counters
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._names = {}
+        self.collection.create_index('name', unique=True, name='name_unique')
+        self.refresh()
+
+    def refresh(self):
+        docs = list(self.collection.find({}, {'name': 1}))
+        with self._lock:
+            for doc in docs:
+                self._ids[doc['name']] = doc['_id']
+                self._names[doc['_id']] = doc['name']
+
+    def id_for(self, name):
+        """Return the ID for a product name, assigning the next one if it is new."""
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        product_id = self._ids.get(name)
+        if product_id is not None:
+            return product_id
+        counter = self.counters.find_one_and_update(
+            {'_id': 'product_ids'}, {'$inc': {'seq': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        try:
+            self.collection.insert_one({'_id': counter['seq'], 'name': name})
+        except DuplicateKeyError:
+            # Another writer named it first; that ID wins and ours is skipped
+            self.refresh()
+            return self._ids[name]
+        with self._lock:
+            self._ids[name] = counter['seq']
+            self._names[counter['seq']] = name
+        return counter['seq']
+
+    def name_for(self, product_id):
+        name = self._names.get(product_id)
+        if name is None:
+            self.refresh()
+            name = self._names.get(product_id, f'product-{product_id}')
+        return name
+
+
+def compact(invoice, product_ids):
+    """Convert an invoice in the API shape to a v2 document.
+
+    Money becomes integer paise, line items become [product_id, quantity,
+    price_paise] and fields that are constant or derivable are dropped.
+    """
+    if invoice.get('v') == SCHEMA_VERSION:
+        return invoice
+    doc = {
+        'v': SCHEMA_VERSION,
+        'payment_id': invoice['payment_id'],
+        'order_id': invoice['order_id'],
+        'timestamp': invoice['timestamp'],
+        'date': invoice.get('date') or time.strftime('%Y-%m-%d', time.localtime(invoice['timestamp'])),
+        'total': to_paise(invoice.get('total_amount', invoice.get('amount', 0))),
+        'items': [
+            [product_ids.id_for(item['name']), int(item.get('quantity', 0)),
+             item['price_paise'] if 'price_paise' in item else to_paise(item.get('price', 0))]
+            for item in invoice.get('products') or []
+        ],
+    }
+    if '_id' in invoice:
+        doc['_id'] = invoice['_id']
+    return doc
+
+
+def expand(doc, product_ids, fields=None):
+    """Return a stored invoice of either version in the API shape, limited to fields if given."""
+    if doc.get('v') == SCHEMA_VERSION:
+        total = doc.get('total', 0) / 100
+        invoice = dict(CONSTANT_FIELDS)
+        invoice.update({
+            'order_id': doc.get('order_id'),
+            'payment_id': doc.get('payment_id'),
+            'transaction_id': doc.get('payment_id'),
+            'timestamp': doc.get('timestamp'),
+            'date': doc.get('date'),
+            'amount': total,
+            'total_amount': total,
+        })
+        if 'timestamp' in doc:
+            invoice['time'] = time.strftime('%H:%M:%S', time.localtime(doc['timestamp']))
+        if 'items' in doc:
+            invoice['products'] = [
+                {'name': product_ids.name_for(product_id), 'quantity': quantity, 'price': price / 100}
+                for product_id, quantity, price in doc['items']
+            ]
+            invoice['total_items'] = len(doc['items'])
+        if '_id' in doc:
+            invoice['_id'] = doc['_id']
+    else:
+        invoice = doc
+    if fields is None:
+        return invoice
+    return {field: invoice[field] for field in fields if field in invoice}
+
+
+def projection_for(fields):
+    """MongoDB projection that loads what the requested API fields are built from."""
+    projection = {'v': 1}
+    for field in fields:
+        for stored in STORED_FIELDS.get(field, (field,)):
+            projection[stored] = 1
+    return projection
+
+
+def migrate(db, batch_size=500, log_every=10000):
+    """Rewrite v1 invoices as v2 in batches; safe to interrupt and run again.
+
+    Only documents without a schema version are read, in _id order, so memory
+    stays at one batch and a rerun picks up where the last one stopped.
+    """
+    from pymongo import ReplaceOne
+
+    product_ids = ProductIds(db)
+    invoices = db.invoices
+    migrated = 0
+    last_id = None
+    while True:
+        query = {'v': {'$exists': False}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(invoices.find(query).sort('_id', 1).limit(batch_size))
+        if not batch:
+            return migrated
+        ops = [ReplaceOne({'_id': doc['_id'], 'v': {'$exists': False}}, compact(doc, product_ids)) for doc in batch]
+        invoices.bulk_write(ops, ordered=False)
+        last_id = batch[-1]['_id']
+        migrated += len(batch)
+        if migrated % log_every < batch_size:
+            print(f"Migrated {migrated} invoices")
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Manage the invoice storage schema")
+    parser.add_argument("--migrate", action="store_true", help="Rewrite older invoices in the compact v2 schema")
+    parser.add_argument("--batch-size", type=int, default=500, help="Invoices rewritten per bulk write")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    args = get_args()
+    if args.migrate:
+        client = MongoClient(os.getenv('MONGODB_URI'))
+        start = time.time()
+        count = migrate(client.smart_checkout, args.batch_size)
+        print(f"Migrated {count} invoices to schema v{SCHEMA_VERSION} in {time.time() - start:.2f}s")
@@ -0,0 +1,283 @@
+import threading
+import time
+from queue import Queue
+
+from broadcast import Broadcaster
+from cart import Cart
+from detections import DetectionBatch
+from flight_recorder import START, STOP
+from frame_hub import FrameHub
+from metrics import REGISTRY, hot_log
+from tracker import IoUTracker
+
+FRAME_QUEUE_SIZE = 10
+
+
+class Lane:
+    def __init__(self, name, source, catalog, socketio, renderers, threshold=0.2,
+                 motion_gate=None, ring=None, pool=None, offload=None, recorder=None, on_first_frame=None):
+        """One checkout lane: a frame source with its own detections, tracker, cart and viewers.
+
+        Lanes share the catalog, the Socket.IO server and (optionally) the
+        FrameRing, EncodePool and offload, but nothing that describes what is on a
+        counter, so lanes in one process cannot see each other's items.
+        Dashboard clients join the lane's Socket.IO room; carts are only
+        broadcast to them. Every pipeline metric is labelled with the lane.
+        recorder, a FlightRecorder, logs the lane's detections and cart
+        events so a checkout can be looked into and replayed later.
+        """
+        self.name = name
+        self.room = f'lane:{name}'
+        self.source = source
+        self.catalog = catalog
+        self.socketio = socketio
+        self.threshold = threshold
+        self.motion_gate = motion_gate
+        self.ring = ring
+        self.recorder = recorder
+        self.on_first_frame = on_first_frame
+        self.first_frame_at = None
+
+        self.latest_detections = DetectionBatch.empty()
+        self.detections_seq = 0  # Incremented for every published DetectionBatch
+        self.detections_cond = threading.Condition()  # Guards the detection state and wakes the cart consumer
+        self.detections_published = {}  # detections_seq -> perf_counter() when it was published
+        self.detection_active = False
+        self.tracker = IoUTracker()
+        self.cart = Cart()
+        self.frame_queue = Queue(maxsize=FRAME_QUEUE_SIZE)  # (frame, detections, lores) for streaming
+        self.frame_hub = FrameHub(
+            self.frame_queue, renderers, offload=offload, pool=pool,
+            release=ring.release_frame if ring is not None else None, lane=name
+        )
+        self.broadcaster = Broadcaster(socketio, 'detection_update', lane=name)
+
+        self.frames_total = REGISTRY.counter('checkout_frames_total', 'Frames received from the frame source', lane=name)
+        self.frame_queue_drops = REGISTRY.counter(
+            'checkout_frame_queue_drops_total', 'Frames dropped because frame_queue was full', lane=name
+        )
+        self.detections_total = REGISTRY.counter('checkout_detections_total', 'Detections above threshold', lane=name)
+        self.static_frames = REGISTRY.counter('checkout_static_frames_total', 'Frames skipped by the motion gate', lane=name)
+        self.cart_updates = REGISTRY.counter('checkout_cart_updates_total', 'Frames run through the tracker', lane=name)
+        self.decode_seconds = REGISTRY.histogram(
+            'checkout_stage_seconds', 'Duration of each pipeline stage', stage='decode', lane=name
+        )
+        self.frame_copy_seconds = REGISTRY.histogram(
+            'checkout_stage_seconds', 'Duration of each pipeline stage', stage='frame_copy', lane=name
+        )
+        self.cart_emit_seconds = REGISTRY.histogram(
+            'checkout_cart_emit_latency_seconds', 'Time from a frame being published to its cart update being emitted',
+            lane=name
+        )
+        REGISTRY.gauge('checkout_frame_queue_depth', 'Frames waiting in frame_queue', read=self.frame_queue.qsize, lane=name)
+
+    def start(self, test_mode=False):
+        """Start encoding, broadcasting, the cart consumer and the frame source."""
+        self.frame_hub.start()
+        self.broadcaster.start()
+        threading.Thread(target=self.emit_detections, daemon=True, name=f'cart-{self.name}').start()
+        if test_mode:
+            threading.Thread(target=self.add_test_detections, daemon=True, name=f'test-{self.name}').start()
+        self.source.start(self.pre_callback)
+
+    def pre_callback(self, request):
+        """Decode detections and queue the raw frame with them for the render stage.
+
+        Static frames (see MotionGate) skip all of that: viewers get the last
+        JPEG again and the cart consumer is not woken.
+        """
+        self.frames_total.inc()
+        moving = getattr(request, 'moving', None)
+        if moving is None:
+            moving = self.frame_moving(request)
+        if not moving:
+            self.static_frames.inc()
+            self.frame_hub.repeat()
+            return
+        metadata = request.get_metadata()
+        np_outputs = self.source.get_outputs(request, metadata)
+        detections = DetectionBatch.empty()
+        if np_outputs is not None:
+            boxes, scores, classes = np_outputs[0][0], np_outputs[2][0], np_outputs[1][0]
+            try:
+                with self.decode_seconds.time():
+                    detections = DetectionBatch.from_outputs(
+                        boxes, scores, classes, self.threshold,
+                        self.source.box_transform(metadata), self.catalog.index.label_array
+                    )
+            except Exception as e:
+                hot_log.log(f'decode_error:{self.name}', f"Lane {self.name}: error decoding detections: {e}")
+            self.detections_total.inc(len(detections))
+            hot_log.log(f'detections:{self.name}', f"Lane {self.name}: found {len(detections)} detections above threshold")
+
+        self.publish(detections)
+
+        # Hand the raw frame to the render stage; overlays are drawn off the camera thread.
+        # Nothing is queued while nobody watches, so a new viewer never gets an old frame
+        if self.frame_hub.subscribers:
+            captured = None if self.frame_queue.full() else self.capture(request)
+            if captured is None:
+                self.frame_queue_drops.inc()
+            else:
+                frame, lores = captured
+                self.frame_queue.put((frame, detections, lores))
+
+        if self.first_frame_at is None:
+            self.first_frame_at = time.time()
+            if self.on_first_frame is not None:
+                self.on_first_frame(self)
+
+    def frame_moving(self, request):
+        """Run a frame through the motion gate; False if it can be skipped as static."""
+        if self.motion_gate is None:
+            return True
+        moving = self.motion_gate.update(self.source.motion_sample(request))
+        # A viewer that just joined a tier still needs one real frame
+        return moving or self.frame_hub.needs_frame()
+
+    def publish(self, detections):
+        """Make detections the lane's latest, waking the cart consumer while detection is active."""
+        with self.detections_cond:
+            self.latest_detections = detections
+            self.detections_seq += 1
+            seq = self.detections_seq
+            if self.detection_active:
+                self.detections_published[seq] = time.perf_counter()
+                self.detections_cond.notify()
+        if self.recorder is not None:
+            self.recorder.record_frame(seq, detections)
+
+    def capture(self, request):
+        """Copy a request's frames out of the camera buffers; return (frame, lores) or None if no room."""
+        with self.frame_copy_seconds.time():
+            if self.ring is None:
+                return self.source.capture_frame(request), self.source.capture_lores(request)
+            slot = self.ring.acquire()
+            if slot is None:
+                return None
+            frame = self.ring.frame(slot)
+            self.source.capture_frame_into(request, frame)
+            lores = self.ring.lores(slot)
+            return frame, lores if self.source.capture_lores_into(request, lores) else None
+
+    def start_detection(self):
+        """Start a new checkout: an empty cart and an empty tracker."""
+        self.clear_cart()
+        if self.motion_gate is not None:
+            # Items already lying on a static counter must still reach the tracker
+            self.motion_gate.reset()
+        with self.detections_cond:
+            self.detection_active = True
+            self.tracker.reset()
+            self.detections_cond.notify()
+            if self.recorder is not None:
+                # Inside the lock, so no frame is tracked between the reset and its record
+                self.recorder.record_event(START, self.detections_seq)
+        print(f"Lane {self.name}: detection started.")
+
+    def stop_detection(self):
+        with self.detections_cond:
+            self.detection_active = False
+            if self.recorder is not None:
+                self.recorder.record_event(STOP, self.detections_seq)
+        print(f"Lane {self.name}: detection stopped.")
+
+    def clear_cart(self, paid=None):
+        """Empty the cart and tell the lane's clients.
+
+        With paid, the products of the cart snapshot an order was priced
+        from, only those lines are taken out, so items scanned after the
+        order was priced stay in the cart to be billed.
+        """
+        deltas = [self.cart.clear()] if paid is None else self.cart.remove_paid(paid)
+        for delta in deltas:
+            self.socketio.emit('cart_delta', delta, to=self.room)
+        snapshot = self.cart.snapshot()
+        snapshot['lane'] = self.name
+        snapshot['published_at'] = time.time()
+        self.broadcaster.publish(snapshot)
+
+    def emit_detections(self):
+        """Add one cart line per newly tracked object and send the cart to the lane's clients.
+
+        Woken by pre_callback for every published frame while detection is active.
+        Each cart change goes out to the lane's room as a 'cart_delta'; the full
+        cart is published as 'detection_update' through the lane's broadcaster,
+        which paces it per client.
+        """
+        last_seq = 0
+
+        while True:
+            with self.detections_cond:
+                self.detections_cond.wait_for(
+                    lambda: self.detection_active and self.detections_seq != last_seq
+                )
+                current_detections = self.latest_detections
+                last_seq = self.detections_seq
+                # Frames skipped while the consumer was busy are never emitted; only time this one
+                published = self.detections_published.pop(last_seq, None)
+                self.detections_published.clear()
+
+            self.cart_updates.inc()
+            new_tracks = self.tracker.update(current_detections)
+            if self.recorder is not None:
+                self.recorder.record_tracked(last_seq)
+            if not new_tracks:
+                continue
+
+            index = self.catalog.index
+            for track in new_tracks:
+                if track.category >= len(index):
+                    continue
+                delta = self.cart.add(index.entries[track.category])
+                if self.recorder is not None:
+                    self.recorder.record_cart_add(last_seq, track.track_id, track.category)
+                print(f"Lane {self.name}: track {track.track_id} added {track.label} to the cart")
+                self.socketio.emit('cart_delta', delta, to=self.room)
+
+            snapshot = self.cart.snapshot()
+            snapshot['lane'] = self.name
+            snapshot['published_at'] = time.time()  # Lets clients measure broadcast latency
+            self.broadcaster.publish(snapshot)
+            if published is not None:
+                self.cart_emit_seconds.observe(time.perf_counter() - published)
+
+    def add_test_detections(self):
+        """Add fake detections for testing visualization.
+
+        Cycles through different product categories to simulate scanning multiple products.
+        Each product stays in view for 2 seconds so the tracker confirms it.
+        """
+        category = 0
+        switch_time = time.time()
+
+        while True:
+            labels = self.catalog.index.label_array
+            self.publish(DetectionBatch.from_pixels([[100, 100, 200, 150]], [category], [0.95], labels))
+
+            if time.time() - switch_time >= 2:
+                print(f"Lane {self.name}: added test detection for {labels[category]}")
+                category = (category + 1) % len(labels)
+                switch_time = time.time()
+
+            time.sleep(0.1)
+
+    def generate_frames(self, overlay=True, tier=0, fps=None, adaptive=False):
+        """Generate MJPEG frames for video streaming from the lane's frame hub."""
+        stream = 'overlay' if overlay else 'clean'
+        if self.motion_gate is not None:
+            self.motion_gate.reset()  # The gate's reference may be from long before this viewer
+        with self.frame_hub.subscribe(stream, tier, fps, adaptive) as subscription:
+            for jpeg in subscription:
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+    def status(self):
+        return {
+            'name': self.name,
+            'detection_active': self.detection_active,
+            'cart_seq': self.cart.seq,
+            'viewers': self.frame_hub.subscribers,
+            'clients': len(self.broadcaster.clients),
+            'first_frame_at': self.first_frame_at,
+        }
@@ -0,0 +1,206 @@
+import bisect
+import threading
+import time
+from queue import Full, Queue
+
+# Upper bounds in seconds, from sub-millisecond decode up to slow network calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=None):
+        """A monotonically increasing count, such as frames dropped at frame_queue."""
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name, self.labels, self.value)]
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=None, read=None):
+        """A value that goes up and down; read(), if given, is called at scrape time."""
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+        self.read = read
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        value = self.value
+        if self.read is not None:
+            try:
+                value = self.read()
+            except Exception:
+                return []
+        return [(self.name, self.labels, value)]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        """Cumulative-bucket distribution of durations in seconds.
+
+        observe() only bumps one bucket under a lock; the cumulative counts
+        Prometheus expects are summed at scrape time.
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+
+    def time(self):
+        """Context manager that observes the duration of its body."""
+        return Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.total
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            samples.append((self.name + '_bucket', dict(self.labels, le=format_value(float(bound))), cumulative))
+        samples.append((self.name + '_sum', self.labels, total))
+        samples.append((self.name + '_count', self.labels, cumulative))
+        return samples
+
+
+class Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    def __init__(self):
+        """Named metrics rendered together in the Prometheus text exposition format.
+
+        Metrics sharing a name but not labels (e.g. one histogram per stage)
+        are grouped under a single HELP/TYPE header.
+        """
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        key = (metric.name, tuple(sorted(metric.labels.items())))
+        with self._lock:
+            existing = self._metrics.get(key)
+            if existing is not None:
+                return existing
+            self._metrics[key] = metric
+        return metric
+
+    def counter(self, name, help, **labels):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, read=None, **labels):
+        return self._register(Gauge(name, help, labels, read))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, **labels):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """Return every metric as Prometheus text (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families = {}
+        for metric in metrics:
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, members in families.items():
+            lines.append(f'# HELP {name} {members[0].help}')
+            lines.append(f'# TYPE {name} {members[0].kind}')
+            for metric in members:
+                for sample, labels, value in metric.samples():
+                    lines.append(f'{sample}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class RateLimitedLog:
+    def __init__(self, interval=5.0, maxsize=1000):
+        """Hot-path logging that never blocks the caller.
+
+        Each key prints at most once per interval, noting how many messages
+        were suppressed since; printing happens on a background thread, and
+        messages are dropped rather than waited on if that thread falls behind.
+        """
+        self.interval = interval
+        self._last = {}  # key -> (last printed at, suppressed since)
+        self._queue = Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def log(self, key, message):
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return
+            self._last[key] = (now, 0)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if suppressed:
+            message = f"{message} ({suppressed} similar suppressed)"
+        try:
+            self._queue.put_nowait(message)
+        except Full:
+            pass
+
+    def _run(self):
+        while True:
+            print(self._queue.get())
+
+
+hot_log = RateLimitedLog()
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, threshold=4.0, pixel_delta=20, hold_frames=15):
+        """Tell static frames apart from ones worth running the pipeline on.
+
+        Each frame is reduced by the source to a small luma sample. A frame
+        counts as motion when more than threshold percent of its sample pixels
+        differ by over pixel_delta from the reference, the sample of the last
+        frame that was processed; comparing against that rather than the
+        previous frame lets slow changes add up until they trigger. Processing
+        continues for hold_frames after the last motion so the tracker sees
+        the scene settle.
+        """
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.hold_frames = hold_frames
+        self.reference = None
+        self.idle_frames = 0
+        self._reset = False
+
+    def reset(self):
+        """Force the next frame through, e.g. after the viewer set changes; safe from any thread."""
+        self._reset = True
+
+    def update(self, sample):
+        """Return True if the frame this sample came from should be processed."""
+        sample = np.asarray(sample)
+        if self._reset or self.reference is None or self.reference.shape != sample.shape:
+            self._reset = False
+            self.reference = sample
+            self.idle_frames = 0
+            return True
+        changed = np.count_nonzero(
+            np.abs(sample.astype(np.int16) - self.reference) > self.pixel_delta
+        )
+        if changed * 100 > self.threshold * sample.size:
+            self.reference = sample
+            self.idle_frames = 0
+            return True
+        self.idle_frames += 1
+        if self.idle_frames <= self.hold_frames:
+            self.reference = sample
+            return True
+        return False
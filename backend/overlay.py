@@ -0,0 +1,70 @@
+import numpy as np
+
+FONT = 0  # cv2.FONT_HERSHEY_SIMPLEX; OpenCV is only imported once drawing starts
+FONT_SCALE = 0.5
+THICKNESS = 2
+COLOR = (0, 255, 0)
+
+
+class TextSprite:
+    __slots__ = ('mask', 'ascent', 'width')
+
+    def __init__(self, text):
+        """Rasterize text once into a boolean mask that can be stamped onto frames."""
+        import cv2
+
+        (width, height), baseline = cv2.getTextSize(text, FONT, FONT_SCALE, THICKNESS)
+        canvas = np.zeros((height + baseline + THICKNESS, width + THICKNESS), dtype=np.uint8)
+        cv2.putText(canvas, text, (0, height), FONT, FONT_SCALE, 255, THICKNESS)
+        self.mask = canvas > 0
+        self.ascent = height
+        self.width = width
+
+
+class OverlayRenderer:
+    def __init__(self, labels):
+        """Pre-render every label and every two-decimal confidence suffix once."""
+        self.labels = list(labels)
+        self.label_sprites = [TextSprite(label) for label in self.labels]
+        self.conf_sprites = [TextSprite(f" ({i / 100:.2f})") for i in range(101)]
+        self._colors = {}
+
+    def draw(self, frame, detections):
+        """Draw boxes and cached label sprites for a DetectionBatch onto frame in place."""
+        import cv2
+
+        if not len(detections):
+            return frame
+        color = self._color_for(frame)
+        for (x, y, w, h), category, conf in zip(
+            detections.boxes.tolist(), detections.categories.tolist(), detections.scores.tolist()
+        ):
+            if 0 <= category < len(self.label_sprites):
+                sprite = self.label_sprites[category]
+                self._blit(frame, sprite, x + 5, y + 15, color)
+                conf_sprite = self.conf_sprites[min(max(int(round(conf * 100)), 0), 100)]
+                self._blit(frame, conf_sprite, x + 5 + sprite.width, y + 15, color)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), COLOR, THICKNESS)
+        return frame
+
+    def _color_for(self, frame):
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        color = self._colors.get(channels)
+        if color is None:
+            color = np.array((COLOR + (0,))[:channels], dtype=frame.dtype)
+            self._colors[channels] = color
+        return color
+
+    @staticmethod
+    def _blit(frame, sprite, x, baseline_y, color):
+        """Stamp sprite with its baseline at (x, baseline_y), clipped to the frame."""
+        top = baseline_y - sprite.ascent
+        mask = sprite.mask
+        h, w = mask.shape
+        fh, fw = frame.shape[:2]
+        x0, y0 = max(x, 0), max(top, 0)
+        x1, y1 = min(x + w, fw), min(top + h, fh)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = mask[y0 - top:y1 - top, x0 - x:x1 - x]
+        frame[y0:y1, x0:x1][region] = color
@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import razorpay
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import REGISTRY
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+ORDER_TTL = 120  # Seconds an order is reused for an identical cart
+
+ORDER_SECONDS = REGISTRY.histogram('checkout_razorpay_call_seconds', 'Duration of Razorpay API calls', call='order_create')
+ORDER_ERRORS = REGISTRY.counter('checkout_razorpay_errors_total', 'Failed Razorpay API calls', call='order_create')
+ORDERS_REUSED = REGISTRY.counter('checkout_razorpay_orders_reused_total', 'Orders shared with an identical cart')
+
+
+class SignatureError(ValueError):
+    pass
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    def __init__(self, timeout, **kwargs):
+        """HTTPAdapter that applies a default timeout to every request it sends."""
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def cart_hash(items, amount, lane=None, seq=None):
+    """Stable digest of one lane's cart, at a cart seq, with its line items and amount in paise."""
+    canonical = json.dumps(
+        {'items': sorted(items or [], key=lambda item: json.dumps(item, sort_keys=True)), 'amount': amount,
+         'lane': lane, 'seq': seq},
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class PaymentGateway:
+    def __init__(self, key_id, key_secret, base_url=None, workers=4, pool_size=8,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), order_ttl=ORDER_TTL):
+        """Razorpay access through one pooled HTTP session and a small worker pool.
+
+        Orders for the same lane's cart at the same seq are shared while in
+        flight and reused for order_ttl seconds, so a double-tapped checkout
+        creates one order; once an order's payment is verified it is never
+        handed out again. base_url points the client at a local stand-in for testing.
+        """
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.order_ttl = order_ttl
+        self.session = requests.Session()
+        adapter = TimeoutHTTPAdapter(timeout, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        options = {'base_url': base_url} if base_url else {}
+        self.client = razorpay.Client(session=self.session, auth=(key_id, key_secret), **options)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='razorpay')
+        self._lock = threading.Lock()
+        self._orders = {}  # cart hash -> (expires_at, future)
+
+    def submit_order(self, amount, items=None, currency='INR', lane=None, seq=None):
+        """Return a future for the Razorpay order of this cart, reusing a recent one if possible."""
+        key = cart_hash(items, amount, lane, seq)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._orders.get(key)
+            if cached is not None and cached[0] > now:
+                future = cached[1]
+                if not (future.done() and future.exception() is not None):
+                    ORDERS_REUSED.inc()
+                    return future
+            future = self.executor.submit(self._create_order, amount, currency)
+            self._orders[key] = (now + self.order_ttl, future)
+            self._expire(now)
+        return future
+
+    def create_order(self, amount, items=None, currency='INR', lane=None, seq=None):
+        """Create (or reuse) an order and wait for it, bounded by the session timeouts."""
+        return self.submit_order(amount, items, currency, lane, seq).result()
+
+    def _create_order(self, amount, currency):
+        try:
+            with ORDER_SECONDS.time():
+                return self.client.order.create(dict(
+                    amount=amount,
+                    currency=currency,
+                    payment_capture='1'
+                ))
+        except Exception:
+            ORDER_ERRORS.inc()
+            raise
+
+    def _expire(self, now):
+        for key in [k for k, (expires_at, _) in self._orders.items() if expires_at <= now]:
+            del self._orders[key]
+
+    def forget_order(self, order_id):
+        """Stop reusing an order, e.g. once it has been paid."""
+        with self._lock:
+            for key, (_, future) in list(self._orders.items()):
+                if future.done() and future.exception() is None and future.result().get('id') == order_id:
+                    del self._orders[key]
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        """Check a checkout signature locally with HMAC-SHA256; raise SignatureError on mismatch."""
+        expected = hmac.new(
+            (self.key_secret or '').encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256
+        ).hexdigest()
+        if not hmac.compare_digest(expected, signature or ''):
+            raise SignatureError("Razorpay signature verification failed")
+        # A paid order must not be reused for the next identical cart
+        self.forget_order(order_id)
@@ -0,0 +1,54 @@
+import argparse
+import itertools
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+order_ids = itertools.count(1)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Answer POST /v1/orders the way Razorpay does, for local gateway testing."""
+
+    delay = 0.0
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/orders':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.delay)
+        body = json.dumps({
+            'id': f"order_standin{next(order_ids):08d}",
+            'entity': 'order',
+            'amount': data.get('amount'),
+            'currency': data.get('currency', 'INR'),
+            'status': 'created',
+            'created_at': int(time.time()),
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def get_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Local stand-in for the Razorpay orders API")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    StandinHandler.delay = args.delay
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StandinHandler)
+    print(f"Razorpay stand-in listening on http://127.0.0.1:{args.port} "
+          f"(set RAZORPAY_BASE_URL to this address)")
+    server.serve_forever()
@@ -0,0 +1,62 @@
+from cart import Cart
+from catalog import CatalogEntry
+
+
+def entry(label, price, category=0):
+    return CatalogEntry(category, label, price)
+
+
+def test_total_is_kept_in_paise():
+    cart = Cart()
+    cart.add(entry('milk', 0.1))
+    cart.add(entry('milk', 0.1))
+    cart.add(entry('bread', 45.5))
+    snapshot = cart.snapshot()
+    assert snapshot['total_paise'] == 4570
+    assert [(item['name'], item['quantity']) for item in snapshot['products']] == [('milk', 2), ('bread', 1)]
+
+
+def test_deltas_since():
+    cart = Cart()
+    cart.add(entry('milk', 30))
+    seq = cart.seq
+    cart.add(entry('milk', 30))
+    cart.add(entry('bread', 45))
+    deltas = cart.deltas_since(seq)
+    assert [(d['seq'], d['op'], d['item']['name']) for d in deltas] == [(2, 'update', 'milk'), (3, 'add', 'bread')]
+    assert deltas[-1]['total_paise'] == 10500
+    assert cart.deltas_since(cart.seq) == []
+
+
+def test_deltas_since_unknown_seq():
+    cart = Cart(history=2)
+    for _ in range(4):
+        cart.add(entry('milk', 30))
+    # Older than the log, or from a cart this process never had
+    assert cart.deltas_since(1) is None
+    assert cart.deltas_since(cart.seq + 1) is None
+    assert len(cart.deltas_since(2)) == 2
+
+
+def test_lines_are_keyed_by_label():
+    cart = Cart()
+    cart.add(entry('milk', 30, category=0))
+    # A catalog reload moved bread to milk's old category
+    cart.add(entry('bread', 45, category=0))
+    assert [item['name'] for item in cart.snapshot()['products']] == ['milk', 'bread']
+
+
+def test_remove_paid_keeps_later_items():
+    cart = Cart()
+    cart.add(entry('milk', 30))
+    cart.add(entry('milk', 30))
+    paid = cart.snapshot()
+    cart.add(entry('milk', 30))
+    cart.add(entry('bread', 45))
+    deltas = cart.remove_paid(paid['products'])
+    assert [d['op'] for d in deltas] == ['update']
+    snapshot = cart.snapshot()
+    assert [(item['name'], item['quantity']) for item in snapshot['products']] == [('milk', 1), ('bread', 1)]
+    assert snapshot['total_paise'] == 7500
+    assert [d['op'] for d in cart.remove_paid(snapshot['products'])] == ['remove', 'remove']
+    assert cart.snapshot()['products'] == []
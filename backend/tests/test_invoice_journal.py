@@ -0,0 +1,72 @@
+import pytest
+
+from invoice_journal import InvoiceJournal
+
+
+def invoice(payment_id, order_id='order_1'):
+    return {'payment_id': payment_id, 'order_id': order_id, 'total_amount': 10.0, 'products': []}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return InvoiceJournal(str(tmp_path / 'invoices.db'))
+
+
+def test_append_dedupes_on_payment_id(journal):
+    assert journal.append(invoice('pay_1'))
+    assert not journal.append(invoice('pay_1'))
+    assert journal.pending_count() == 1
+    assert journal.has_payment('pay_1')
+    assert not journal.has_payment('pay_2')
+
+
+def test_pending_survives_reopening(tmp_path):
+    path = str(tmp_path / 'invoices.db')
+    InvoiceJournal(path).append(invoice('pay_1'))
+    assert InvoiceJournal(path).pending_count() == 1
+
+
+def test_orders_are_marked_paid(journal):
+    snapshot = {'seq': 4, 'products': [{'name': 'milk', 'quantity': 1}], 'total_paise': 3000}
+    journal.remember_order('order_1', '2', snapshot, 'run')
+    assert journal.order('order_1') == ('2', snapshot, 'run', None)
+    assert journal.order('order_2') is None
+    journal.append(invoice('pay_1', 'order_1'))
+    assert journal.order('order_1')[3] == 'pay_1'
+
+
+def test_flush_stores_each_invoice_once(journal):
+    mongomock = pytest.importorskip('mongomock')
+    pytest.importorskip('pymongo')
+
+    collection = mongomock.MongoClient().db.invoices
+    flushed = []
+    journal.attach(collection)
+    journal.on_flush(flushed.extend)
+    # Stored by an earlier flush that died before clearing the journal
+    collection.insert_one(invoice('pay_1'))
+    journal.append(invoice('pay_1'))
+    journal.append(invoice('pay_2'))
+    assert journal.flush() == 2
+    assert journal.pending_count() == 0
+    assert sorted(doc['payment_id'] for doc in collection.find()) == ['pay_1', 'pay_2']
+    assert [doc['payment_id'] for doc in flushed] == ['pay_2']
+
+
+def test_failing_transform_does_not_block_the_queue(journal):
+    mongomock = pytest.importorskip('mongomock')
+    pytest.importorskip('pymongo')
+
+    def transform(doc):
+        if doc['payment_id'] == 'pay_bad':
+            raise KeyError('price')
+        return dict(doc)
+
+    collection = mongomock.MongoClient().db.invoices
+    journal.attach(collection, transform)
+    journal.append(invoice('pay_bad'))
+    journal.append(invoice('pay_2'))
+    journal.flush()
+    assert journal.pending_count() == 0
+    assert [doc['payment_id'] for doc in collection.find()] == ['pay_2']
+    assert journal.has_payment('pay_bad')
@@ -0,0 +1,75 @@
+import pytest
+
+from invoice_schema import SCHEMA_VERSION, compact, expand
+
+INVOICE = {
+    'order_id': 'order_1',
+    'payment_id': 'pay_1',
+    'amount': 105.5,
+    'products': [
+        {'name': 'milk', 'quantity': 2, 'price': 30.0, 'price_paise': 3000},
+        {'name': 'bread', 'quantity': 1, 'price': 45.5},
+    ],
+    'timestamp': 1760000000.0,
+    'date': '2026-10-09',
+    'time': '10:13:20',
+    'status': 'paid',
+    'payment_method': 'razorpay',
+    'currency': 'INR',
+    'total_items': 2,
+    'total_amount': 105.5,
+    'payment_status': 'success',
+    'transaction_id': 'pay_1',
+}
+
+
+class Names:
+    """The part of ProductIds that compact and expand use, without MongoDB."""
+
+    def __init__(self):
+        self.names = []
+
+    def id_for(self, name):
+        if name not in self.names:
+            self.names.append(name)
+        return self.names.index(name) + 1
+
+    def name_for(self, product_id):
+        return self.names[product_id - 1]
+
+
+def check_round_trip(product_ids):
+    doc = compact(INVOICE, product_ids)
+    assert doc['v'] == SCHEMA_VERSION
+    assert doc['total'] == 10550
+    assert doc['items'] == [[product_ids.id_for('milk'), 2, 3000], [product_ids.id_for('bread'), 1, 4550]]
+    assert compact(doc, product_ids) is doc
+
+    invoice = expand(doc, product_ids)
+    for field in ('order_id', 'payment_id', 'transaction_id', 'timestamp', 'date', 'amount', 'total_amount',
+                  'total_items', 'status', 'payment_method', 'currency', 'payment_status'):
+        assert invoice[field] == INVOICE[field], field
+    assert invoice['products'] == [{'name': p['name'], 'quantity': p['quantity'], 'price': p['price']}
+                                   for p in INVOICE['products']]
+
+
+def test_round_trip():
+    check_round_trip(Names())
+
+
+def test_round_trip_with_product_ids():
+    mongomock = pytest.importorskip('mongomock')
+    pytest.importorskip('pymongo')
+    from invoice_schema import ProductIds
+
+    db = mongomock.MongoClient().db
+    check_round_trip(ProductIds(db))
+    # IDs survive a new ProductIds, e.g. after a restart
+    assert ProductIds(db).name_for(1) == 'milk'
+
+
+def test_expand_fields_and_v1_documents():
+    names = Names()
+    doc = compact(INVOICE, names)
+    assert expand(doc, names, ['amount', 'payment_id']) == {'amount': 105.5, 'payment_id': 'pay_1'}
+    assert expand(dict(INVOICE), Names()) == INVOICE
@@ -0,0 +1,57 @@
+import numpy as np
+
+from detections import DetectionBatch
+from tracker import IoUTracker
+
+LABELS = np.array(['milk', 'bread'], dtype=object)
+
+
+def batch(*objects):
+    """DetectionBatch of (category, x, y) objects 50 pixels square."""
+    if not objects:
+        return DetectionBatch.empty()
+    return DetectionBatch.from_pixels(
+        [[x, y, 50, 50] for _, x, y in objects], [c for c, _, _ in objects], [0.9] * len(objects), LABELS
+    )
+
+
+def test_confirmed_once_after_min_hits():
+    tracker = IoUTracker(min_hits=3)
+    confirmed = [tracker.update(batch((0, 100 + 2 * i, 100))) for i in range(6)]
+    assert [len(c) for c in confirmed] == [0, 0, 1, 0, 0, 0]
+    assert confirmed[2][0].label == 'milk'
+
+
+def test_category_change_starts_a_new_track():
+    tracker = IoUTracker(min_hits=2)
+    tracker.update(batch((0, 100, 100)))
+    tracker.update(batch((1, 100, 100)))
+    assert sorted(t.category for t in tracker.tracks) == [0, 1]
+    assert len({t.track_id for t in tracker.tracks}) == 2
+
+
+def test_track_dropped_after_max_misses():
+    tracker = IoUTracker(min_hits=1, max_misses=2)
+    assert len(tracker.update(batch((0, 100, 100)))) == 1
+    for _ in range(2):
+        tracker.update(batch())
+    assert len(tracker.tracks) == 1
+    tracker.update(batch())
+    assert tracker.tracks == []
+    # The object coming back is a new track and is counted again
+    assert len(tracker.update(batch((0, 100, 100)))) == 1
+
+
+def test_two_objects_tracked_separately():
+    tracker = IoUTracker(min_hits=2)
+    tracker.update(batch((0, 0, 0), (0, 300, 300)))
+    confirmed = tracker.update(batch((0, 2, 2), (0, 302, 302)))
+    assert len(confirmed) == 2
+    assert len(tracker.tracks) == 2
+
+
+def test_reset_forgets_tracks():
+    tracker = IoUTracker(min_hits=2)
+    tracker.update(batch((0, 100, 100)))
+    tracker.reset()
+    assert tracker.update(batch((0, 100, 100))) == []
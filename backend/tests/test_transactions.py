@@ -0,0 +1,66 @@
+import pytest
+
+from transactions import build_query, encode_cursor
+
+
+def test_date_range_filter():
+    query, fields, limit = build_query({'start_date': '2026-01-01', 'end_date': '2026-01-31'})
+    assert query == {'date': {'$gte': '2026-01-01', '$lte': '2026-01-31'}}
+    assert fields is None and limit is None
+    assert build_query({'start_date': '2026-01-01'})[0] == {'date': {'$gte': '2026-01-01'}}
+    assert build_query({})[0] == {}
+
+
+def test_fields_always_include_timestamp():
+    _, fields, _ = build_query({'fields': 'payment_id, total_amount,'})
+    assert fields == ['payment_id', 'total_amount', 'timestamp']
+
+
+@pytest.mark.parametrize('limit', ['abc', '0', '-3'])
+def test_bad_limit(limit):
+    with pytest.raises(ValueError):
+        build_query({'limit': limit})
+
+
+def test_cursor_round_trip():
+    bson = pytest.importorskip('bson')
+    from transactions import decode_cursor
+
+    object_id = bson.ObjectId()
+    token = encode_cursor({'timestamp': 1760000000.25, '_id': object_id})
+    assert decode_cursor(token) == (1760000000.25, object_id)
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor')
+
+
+def test_cursor_and_dates_combine():
+    bson = pytest.importorskip('bson')
+
+    token = encode_cursor({'timestamp': 5.0, '_id': bson.ObjectId()})
+    query, _, _ = build_query({'cursor': token, 'start_date': '2026-01-01'})
+    assert query['$and'][0] == {'date': {'$gte': '2026-01-01'}}
+    assert query['$and'][1]['$or'][0] == {'timestamp': {'$lt': 5.0}}
+
+
+def test_pages_cover_every_invoice_once():
+    mongomock = pytest.importorskip('mongomock')
+    from transactions import fetch_page
+
+    collection = mongomock.MongoClient().db.invoices
+    # Two invoices share a timestamp, so the _id tie-break decides their order
+    collection.insert_many([
+        {'payment_id': f'pay_{i}', 'timestamp': float(i // 2), 'date': '2026-01-01'} for i in range(7)
+    ])
+    seen = []
+    args = {'limit': '2'}
+    while True:
+        query, fields, limit = build_query(args)
+        invoices, cursor = fetch_page(collection, query, fields, limit, lambda doc, fields: doc)
+        seen.extend(invoice['payment_id'] for invoice in invoices)
+        if cursor is None:
+            break
+        args = {'limit': '2', 'cursor': cursor}
+    assert sorted(seen) == [f'pay_{i}' for i in range(7)]
+    assert len(seen) == len(set(seen))
+    timestamps = [int(payment_id[4:]) // 2 for payment_id in seen]
+    assert timestamps == sorted(timestamps, reverse=True)
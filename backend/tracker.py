@@ -0,0 +1,100 @@
+import itertools
+import threading
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise intersection-over-union of (x, y, w, h) boxes in a (N, 4) and b (M, 4)."""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    __slots__ = ('track_id', 'category', 'label', 'box', 'hits', 'misses', 'counted')
+
+    def __init__(self, track_id, category, label, box):
+        """An object followed across frames by the tracker."""
+        self.track_id = track_id
+        self.category = category
+        self.label = label
+        self.box = box
+        self.hits = 1
+        self.misses = 0
+        self.counted = False
+
+
+class IoUTracker:
+    def __init__(self, iou_threshold=0.3, min_hits=3, max_misses=15):
+        """Give each detected object a persistent ID by IoU association between frames.
+
+        A track is confirmed after min_hits matched frames and dropped after
+        max_misses consecutive frames without a match.
+        """
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget every live track, e.g. when a new checkout starts."""
+        with self._lock:
+            self.tracks = []
+
+    def update(self, detections):
+        """Associate a DetectionBatch with live tracks; return tracks confirmed on this frame."""
+        with self._lock:
+            boxes = detections.boxes
+            categories = detections.categories
+            matched_tracks = set()
+            matched_dets = set()
+
+            if self.tracks and len(detections):
+                track_boxes = np.array([t.box for t in self.tracks], dtype=np.float32)
+                track_cats = np.array([t.category for t in self.tracks], dtype=np.int32)
+                iou = iou_matrix(track_boxes, boxes)
+                iou[track_cats[:, None] != categories[None, :]] = 0.0
+                rows, cols = np.nonzero(iou >= self.iou_threshold)
+                order = np.argsort(-iou[rows, cols], kind='stable')
+                for t, d in zip(rows[order].tolist(), cols[order].tolist()):
+                    if t in matched_tracks or d in matched_dets:
+                        continue
+                    matched_tracks.add(t)
+                    matched_dets.add(d)
+                    track = self.tracks[t]
+                    track.box = boxes[d].tolist()
+                    track.hits += 1
+                    track.misses = 0
+
+            survivors = []
+            for index, track in enumerate(self.tracks):
+                if index not in matched_tracks:
+                    track.misses += 1
+                    if track.misses > self.max_misses:
+                        continue
+                survivors.append(track)
+
+            for d in range(len(detections)):
+                if d not in matched_dets:
+                    survivors.append(Track(
+                        next(self._ids), int(categories[d]), detections.labels[d], boxes[d].tolist()
+                    ))
+            self.tracks = survivors
+
+            confirmed = []
+            for track in self.tracks:
+                if not track.counted and track.hits >= self.min_hits:
+                    track.counted = True
+                    confirmed.append(track)
+            return confirmed
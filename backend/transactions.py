@@ -0,0 +1,111 @@
+import base64
+import json
+
+from invoice_schema import projection_for
+
+ASCENDING = 1  # pymongo.ASCENDING, without importing pymongo at startup
+DESCENDING = -1  # pymongo.DESCENDING
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+SORT_ORDER = [('timestamp', DESCENDING), ('_id', DESCENDING)]
+
+
+def ensure_indexes(collection):
+    """Create the indexes /transactions pages and filters on."""
+    collection.create_index(SORT_ORDER, name='timestamp_id_desc')
+    collection.create_index([('date', ASCENDING)], name='date_asc')
+
+
+def encode_cursor(doc):
+    """Opaque keyset cursor pointing just past doc in timestamp/_id order."""
+    raw = json.dumps([doc['timestamp'], str(doc['_id'])]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(token):
+    from bson import ObjectId
+
+    try:
+        timestamp, object_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return float(timestamp), ObjectId(object_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_query(args):
+    """Translate /transactions query parameters into (filter, fields, limit).
+
+    Supported parameters: limit, cursor, fields (comma separated) and
+    start_date/end_date (YYYY-MM-DD, inclusive). Raises ValueError on bad input.
+    """
+    clauses = []
+
+    date_range = {}
+    if args.get('start_date'):
+        date_range['$gte'] = args['start_date']
+    if args.get('end_date'):
+        date_range['$lte'] = args['end_date']
+    if date_range:
+        clauses.append({'date': date_range})
+
+    if args.get('cursor'):
+        timestamp, object_id = decode_cursor(args['cursor'])
+        clauses.append({'$or': [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, '_id': {'$lt': object_id}},
+        ]})
+
+    query = {'$and': clauses} if len(clauses) > 1 else (clauses[0] if clauses else {})
+
+    fields = None
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        # timestamp is always returned; with _id it builds the next cursor
+        if 'timestamp' not in fields:
+            fields.append('timestamp')
+
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer")
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    return query, fields, limit
+
+
+def _find(collection, query, fields, limit):
+    projection = projection_for(fields) if fields else None
+    cursor = collection.find(query, projection).sort(SORT_ORDER)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def fetch_page(collection, query, fields, limit, expand):
+    """Return (invoices, next_cursor) for one page; next_cursor is None on the last page.
+
+    expand(doc, fields) turns a stored document into the API shape.
+    """
+    limit = min(limit or DEFAULT_LIMIT, MAX_LIMIT)
+    # Fetch one extra document to learn whether another page exists
+    docs = list(_find(collection, query, fields, limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    invoices = []
+    for doc in docs[:limit]:
+        doc.pop('_id', None)
+        invoices.append(expand(doc, fields))
+    return invoices, next_cursor
+
+
+def stream_documents(collection, query, fields, expand, limit=None, batch_size=200):
+    """Yield matching invoices as NDJSON lines while the MongoDB cursor advances."""
+    cursor = _find(collection, query, fields, limit).batch_size(batch_size)
+    try:
+        for doc in cursor:
+            doc.pop('_id', None)
+            yield json.dumps(expand(doc, fields), default=str) + '\n'
+    finally:
+        cursor.close()
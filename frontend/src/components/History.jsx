@@ -4,6 +4,8 @@ const History = ({ theme, ipAddress }) => {
   const [transactions, setTransactions] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchTransactions();
@@ -22,6 +24,7 @@ const History = ({ theme, ipAddress }) => {
       
       if (data.status === 'success') {
         setTransactions(data.transactions);
+        setNextCursor(data.next_cursor);
       } else {
         throw new Error(data.message || 'Failed to fetch transactions');
       }
@@ -33,6 +36,28 @@ const History = ({ theme, ipAddress }) => {
     }
   };
 
+  const loadMoreTransactions = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await fetch(
+        `http://${ipAddress}:5000/transactions?cursor=${encodeURIComponent(nextCursor)}`
+      );
+      const data = await response.json();
+
+      if (data.status === 'success') {
+        setTransactions((previous) => [...previous, ...data.transactions]);
+        setNextCursor(data.next_cursor);
+      } else {
+        throw new Error(data.message || 'Failed to fetch transactions');
+      }
+    } catch (error) {
+      console.error('Error fetching more transactions:', error);
+      setError(error.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatDate = (timestamp) => {
     return new Date(timestamp * 1000).toLocaleString();
   };
@@ -138,6 +163,15 @@ const History = ({ theme, ipAddress }) => {
               </div>
             </div>
           ))}
+          {nextCursor && (
+            <button
+              onClick={loadMoreTransactions}
+              disabled={loadingMore}
+              className={`w-full py-2 rounded-lg ${theme === 'dark' ? 'bg-blue-600 hover:bg-blue-700' : 'bg-blue-500 hover:bg-blue-600'} text-white disabled:opacity-50`}
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>
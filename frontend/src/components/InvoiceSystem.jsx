@@ -1,43 +1,50 @@
 import { useState, useEffect } from 'react'
-import io from 'socket.io-client'
+import { acquireSocket, releaseSocket } from '../socket'
 
 const InvoiceSystem = ({ theme, ipAddress }) => {
   const [detections, setDetections] = useState([])
+  const [totalPaise, setTotalPaise] = useState(0)
   const [invoiceNumber] = useState(`INV-${Math.floor(Math.random() * 10000)}`)
   const [currentDate] = useState(new Date().toLocaleDateString())
   const [loading, setLoading] = useState(false)
 
   useEffect(() => {
-    const socket = io(`http://${ipAddress}:5000`)
+    const socket = acquireSocket(ipAddress)
 
-    socket.on('detection_update', (data) => {
-      console.log('Received detection update:', data);
+    // Acknowledging tells the server this tab is ready for the next cart update
+    const onDetectionUpdate = (data, ack) => {
       if (data.products) {
         setDetections(data.products);
       }
-    })
+      // The server keeps the cart total in paise; it is shown, never recomputed here
+      if (data.total_paise !== undefined) {
+        setTotalPaise(data.total_paise)
+      }
+      if (ack) {
+        ack()
+      }
+    }
+    socket.on('detection_update', onDetectionUpdate)
 
     return () => {
-      socket.disconnect()
+      socket.off('detection_update', onDetectionUpdate)
+      releaseSocket(ipAddress)
     }
   }, [ipAddress])
 
-  const calculateTotal = () => {
-    return detections.reduce((total, item) => total + (item.price * item.quantity), 0)
-  }
-
   const handleCheckout = async () => {
     try {
       setLoading(true)
-      const amount = calculateTotal()
-      
-      // Create order
+      // Create order; the server prices it from its own cart
       const orderResponse = await fetch(`http://${ipAddress}:5000/create-order`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ amount })
+        body: JSON.stringify({})
       })
       const orderData = await orderResponse.json()
+      if (!orderResponse.ok) {
+        throw new Error(orderData.error)
+      }
 
       // Initialize Razorpay
       const options = {
@@ -55,9 +62,7 @@ const InvoiceSystem = ({ theme, ipAddress }) => {
               body: JSON.stringify({
                 razorpay_payment_id: response.razorpay_payment_id,
                 razorpay_order_id: response.razorpay_order_id,
-                razorpay_signature: response.razorpay_signature,
-                amount: amount,
-                products: detections
+                razorpay_signature: response.razorpay_signature
               })
             })
             const paymentData = await paymentResponse.json()
@@ -65,6 +70,7 @@ const InvoiceSystem = ({ theme, ipAddress }) => {
             if (paymentData.status === 'success') {
               alert('Payment successful! Invoice has been stored.')
               setDetections([]) // Clear cart after successful payment
+              setTotalPaise(0)
             }
           } catch (error) {
             console.error('Payment verification failed:', error)
@@ -131,7 +137,7 @@ const InvoiceSystem = ({ theme, ipAddress }) => {
       <div className="mt-auto space-y-2 pt-4">
         <div className={`flex justify-between font-semibold border-t ${theme === 'dark' ? 'border-gray-600 text-white' : 'border-gray-200 text-gray-900'} pt-2`}>
           <span>Total:</span>
-          <span>&#8377; {calculateTotal().toFixed(2)}</span>
+          <span>&#8377; {(totalPaise / 100).toFixed(2)}</span>
         </div>
         <button
           onClick={handleCheckout}
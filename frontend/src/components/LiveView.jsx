@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import io from 'socket.io-client'
+import { acquireSocket, releaseSocket } from '../socket'
 
 const LiveView = ({ onConnectionError, videoEnabled, detectionsEnabled, theme, ipAddress }) => {
   const [socket, setSocket] = useState(null)
@@ -7,44 +7,38 @@ const LiveView = ({ onConnectionError, videoEnabled, detectionsEnabled, theme, i
   const [detections, setDetections] = useState([])
   const [isDetecting, setIsDetecting] = useState(false)
 
-  const connectToRaspberryPi = () => {
-    if (socket) {
-      socket.disconnect()
-    }
-
-    try {
-      const newSocket = io(`http://${ipAddress}:5000`)
-      
-      newSocket.on('connect', () => {
-        setIsConnected(true)
-        onConnectionError(false)
-      })
-
-      newSocket.on('connect_error', () => {
-        setIsConnected(false)
-        onConnectionError(true)
-      })
-
-      // Changed to match work.html implementation
-      newSocket.on('detection_update', (data) => {
-        if (data.products) {
-          setDetections(data.products)
-        }
-      })
+  useEffect(() => {
+    const sharedSocket = acquireSocket(ipAddress)
 
-      setSocket(newSocket)
-    } catch (error) {
-      console.error('Failed to connect:', error)
+    const onConnect = () => {
+      setIsConnected(true)
+      onConnectionError(false)
+    }
+    const onConnectError = () => {
+      setIsConnected(false)
       onConnectionError(true)
     }
-  }
+    // Acknowledging tells the server this tab is ready for the next cart update
+    const onDetectionUpdate = (data, ack) => {
+      if (data.products) {
+        setDetections(data.products)
+      }
+      if (ack) {
+        ack()
+      }
+    }
+
+    sharedSocket.on('connect', onConnect)
+    sharedSocket.on('connect_error', onConnectError)
+    sharedSocket.on('detection_update', onDetectionUpdate)
+    setIsConnected(sharedSocket.connected)
+    setSocket(sharedSocket)
 
-  useEffect(() => {
-    connectToRaspberryPi()
     return () => {
-      if (socket) {
-        socket.disconnect()
-      }
+      sharedSocket.off('connect', onConnect)
+      sharedSocket.off('connect_error', onConnectError)
+      sharedSocket.off('detection_update', onDetectionUpdate)
+      releaseSocket(ipAddress)
     }
   }, [ipAddress])
 
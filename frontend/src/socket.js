@@ -0,0 +1,26 @@
+import io from 'socket.io-client'
+
+// One Socket.IO connection per backend address, shared by every component in the tab
+const connections = new Map()
+
+export function acquireSocket(ipAddress) {
+  let entry = connections.get(ipAddress)
+  if (!entry) {
+    entry = { socket: io(`http://${ipAddress}:5000`), users: 0 }
+    connections.set(ipAddress, entry)
+  }
+  entry.users += 1
+  return entry.socket
+}
+
+export function releaseSocket(ipAddress) {
+  const entry = connections.get(ipAddress)
+  if (!entry) {
+    return
+  }
+  entry.users -= 1
+  if (entry.users === 0) {
+    entry.socket.disconnect()
+    connections.delete(ipAddress)
+  }
+}